@@ -1,13 +1,15 @@
 import os
 import time
+import asyncio
 import json
 from fastapi import FastAPI, Request, Depends, UploadFile, File, Form
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 from typing import List, Optional
 from dotenv import load_dotenv
+load_dotenv()
 
-from app.openai_client import create_thread, add_message, run_assistant_structured, run_assistant_stream, upload_file
+from app.openai_client import create_thread, user_message, run_assistant_structured_async, run_assistant_stream, upload_file_async
 from app.storage import get_ids, get_assistant_ids, get_all_assistant_ids
 from app.router import route_query
 from app.metrics import metrics
@@ -21,7 +23,6 @@ import redis.asyncio as redis
 from fastapi_limiter import FastAPILimiter
 from fastapi_limiter.depends import RateLimiter
 
-load_dotenv()
 app = FastAPI()
 
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
@@ -206,11 +207,12 @@ async def chat(
         try:
             file_ids = []
             if files:
-                for file in files:
-                    if file.filename:
-                        file_content = await file.read()
-                        uploaded_file = upload_file(file_content, file.filename)
-                        file_ids.append(uploaded_file.id)
+                # Stream the spooled uploads straight through instead of reading them into memory,
+                # and send them to OpenAI concurrently
+                uploaded = await asyncio.gather(*(
+                    upload_file_async(file.file, file.filename) for file in files if file.filename
+                ))
+                file_ids = [f.id for f in uploaded]
             
             # If no new files but user is asking about data, re-attach previous files from this thread
             if not file_ids and detect_data_reference(user_msg):
@@ -222,8 +224,7 @@ async def chat(
             if file_ids:
                 track_thread_files(thread_id, file_ids)
             
-            add_message(thread_id, "user", user_msg, file_ids=file_ids if file_ids else None)
-            result = run_assistant_structured(thread_id, assistant_id)
+            result = await run_assistant_structured_async(thread_id, assistant_id, additional_messages=[user_message(user_msg, file_ids)])
             
             latency_ms = (time.time() - start_time) * 1000
             usage = result.get("usage", {})
@@ -266,11 +267,10 @@ async def chat(
         # Step 2: Upload files if provided
         file_ids = []
         if files:
-            for file in files:
-                if file.filename:
-                    file_content = await file.read()
-                    uploaded_file = upload_file(file_content, file.filename)
-                    file_ids.append(uploaded_file.id)
+            uploaded = await asyncio.gather(*(
+                upload_file_async(file.file, file.filename) for file in files if file.filename
+            ))
+            file_ids = [f.id for f in uploaded]
         
         # Check if this is a data analysis flow
         is_data_flow = is_data_analysis_flow(user_msg, bool(file_ids))
@@ -297,8 +297,7 @@ async def chat(
             if not assistant_id:
                 return JSONResponse({"error": f"Assistant not found. Run: python scripts/seed_multi_assistants.py"}, status_code=500)
             
-            add_message(analysis_thread_id, "user", user_msg, file_ids=analysis_file_ids if analysis_file_ids else None)
-            result = run_assistant_structured(analysis_thread_id, assistant_id)
+            result = await run_assistant_structured_async(analysis_thread_id, assistant_id, additional_messages=[user_message(user_msg, analysis_file_ids)])
             
             latency_ms = (time.time() - start_time) * 1000
             usage = result.get("usage", {})
@@ -348,8 +347,7 @@ async def chat(
             if file_ids:
                 track_thread_files(thread_id, file_ids)
             
-            add_message(thread_id, "user", user_msg, file_ids=file_ids if file_ids else None)
-            primary_result = run_assistant_structured(thread_id, primary_assistant_id)
+            primary_result = await run_assistant_structured_async(thread_id, primary_assistant_id, additional_messages=[user_message(user_msg, file_ids)])
             total_usage = primary_result.get("usage", {})
         
         # Strategy 2: Consult-then-decide (0.5 <= confidence < 0.8 OR high-risk)
@@ -368,8 +366,7 @@ async def chat(
                 if file_ids:
                     track_thread_files(thread_id, file_ids)
                 
-                add_message(thread_id, "user", user_msg, file_ids=file_ids if file_ids else None)
-                primary_result = run_assistant_structured(thread_id, primary_assistant_id)
+                primary_result = await run_assistant_structured_async(thread_id, primary_assistant_id, additional_messages=[user_message(user_msg, file_ids)])
                 total_usage = primary_result.get("usage", {})
             else:
                 # Run primary first
@@ -385,8 +382,7 @@ async def chat(
                 if file_ids:
                     track_thread_files(thread_id_primary, file_ids)
                 
-                add_message(thread_id_primary, "user", user_msg, file_ids=file_ids if file_ids else None)
-                primary_result = run_assistant_structured(thread_id_primary, primary_assistant_id)
+                primary_result = await run_assistant_structured_async(thread_id_primary, primary_assistant_id, additional_messages=[user_message(user_msg, file_ids)])
                 
                 # Then ask reviewer to critique (Devil's Advocate pass)
                 thread_id_reviewer = _get_or_create_thread(top2_label)
@@ -414,8 +410,7 @@ Please provide a "Devil's Advocate" critique from a {top2_label} perspective. Sp
 
 Be constructive and specific. Focus on adding value, not just criticizing."""
                 
-                add_message(thread_id_reviewer, "user", critique_prompt, file_ids=file_ids if file_ids else None)
-                reviewer_result = run_assistant_structured(thread_id_reviewer, reviewer_assistant_id)
+                reviewer_result = await run_assistant_structured_async(thread_id_reviewer, reviewer_assistant_id, additional_messages=[user_message(critique_prompt, file_ids)])
                 
                 # Aggregate usage
                 primary_usage = primary_result.get("usage", {})
@@ -442,8 +437,7 @@ Be constructive and specific. Focus on adding value, not just criticizing."""
                 if file_ids:
                     track_thread_files(thread_id, file_ids)
                 
-                add_message(thread_id, "user", user_msg, file_ids=file_ids if file_ids else None)
-                primary_result = run_assistant_structured(thread_id, primary_assistant_id)
+                primary_result = await run_assistant_structured_async(thread_id, primary_assistant_id, additional_messages=[user_message(user_msg, file_ids)])
                 total_usage = primary_result.get("usage", {})
             else:
                 # Run both in parallel (sequentially for now, but could be parallelized)
@@ -459,13 +453,11 @@ Be constructive and specific. Focus on adding value, not just criticizing."""
                 if file_ids:
                     track_thread_files(thread_id_primary, file_ids)
                 
-                add_message(thread_id_primary, "user", user_msg, file_ids=file_ids if file_ids else None)
-                primary_result = run_assistant_structured(thread_id_primary, primary_assistant_id)
+                primary_result = await run_assistant_structured_async(thread_id_primary, primary_assistant_id, additional_messages=[user_message(user_msg, file_ids)])
                 
                 thread_id_reviewer = _get_or_create_thread(top2_label)
                 # Reviewer also gets the same files if available
-                add_message(thread_id_reviewer, "user", user_msg, file_ids=file_ids if file_ids else None)
-                reviewer_result = run_assistant_structured(thread_id_reviewer, reviewer_assistant_id)
+                reviewer_result = await run_assistant_structured_async(thread_id_reviewer, reviewer_assistant_id, additional_messages=[user_message(user_msg, file_ids)])
                 
                 # Aggregate usage
                 primary_usage = primary_result.get("usage", {})
@@ -680,8 +672,7 @@ async def chat_stream(
         for file in files:
             if file.filename:
                 try:
-                    file_content = await file.read()
-                    uploaded_file = upload_file(file_content, file.filename)
+                    uploaded_file = await upload_file_async(file.file, file.filename)
                     file_ids.append(uploaded_file.id)
                 except Exception as e:
                     # If file read fails, return error immediately
@@ -718,10 +709,8 @@ async def chat_stream(
                 if file_ids:
                     track_thread_files(thread_id, file_ids)
                 
-                add_message(thread_id, "user", user_msg, file_ids=file_ids if file_ids else None)
-                
                 # Stream response
-                for chunk in run_assistant_stream(thread_id, assistant_id):
+                for chunk in run_assistant_stream(thread_id, assistant_id, additional_messages=[user_message(user_msg, file_ids)]):
                     chunk["routing"] = {"strategy": "legacy"}
                     yield f"data: {json.dumps(chunk)}\n\n"
                     
@@ -808,12 +797,10 @@ async def chat_stream(
                     yield f"data: {json.dumps({'type': 'error', 'error': error_msg})}\n\n"
                     return
                 
-                add_message(analysis_thread_id, "user", user_msg, file_ids=analysis_file_ids if analysis_file_ids else None)
-                
                 yield f"data: {json.dumps({'type': 'routing', 'strategy': 'data_analysis_flow', 'label': 'investor', 'confidence': 1.0})}\n\n"
                 
                 # Stream response from analysis thread
-                for chunk in run_assistant_stream(analysis_thread_id, assistant_id):
+                for chunk in run_assistant_stream(analysis_thread_id, assistant_id, additional_messages=[user_message(user_msg, analysis_file_ids)]):
                     chunk["routing"] = {"strategy": "data_analysis_flow", "label": "investor"}
                     yield f"data: {json.dumps(chunk)}\n\n"
                     
@@ -883,12 +870,10 @@ async def chat_stream(
                 if final_file_ids:
                     track_thread_files(thread_id, final_file_ids)
                 
-                add_message(thread_id, "user", final_message, file_ids=final_file_ids if final_file_ids else None)
-                
                 yield f"data: {json.dumps({'type': 'routing', 'strategy': 'winner_take_all', 'label': label, 'confidence': confidence})}\n\n"
                 
                 # Stream primary response
-                for chunk in run_assistant_stream(thread_id, primary_assistant_id):
+                for chunk in run_assistant_stream(thread_id, primary_assistant_id, additional_messages=[user_message(final_message, final_file_ids)]):
                     chunk["routing"] = routing
                     yield f"data: {json.dumps(chunk)}\n\n"
                     
@@ -914,11 +899,9 @@ async def chat_stream(
                     if final_file_ids:
                         track_thread_files(thread_id, final_file_ids)
                     
-                    add_message(thread_id, "user", final_message, file_ids=final_file_ids if final_file_ids else None)
-                    
                     yield f"data: {json.dumps({'type': 'routing', 'strategy': 'winner_take_all', 'label': label, 'confidence': confidence})}\n\n"
                     
-                    for chunk in run_assistant_stream(thread_id, primary_assistant_id):
+                    for chunk in run_assistant_stream(thread_id, primary_assistant_id, additional_messages=[user_message(final_message, final_file_ids)]):
                         chunk["routing"] = routing
                         yield f"data: {json.dumps(chunk)}\n\n"
                         
@@ -941,14 +924,12 @@ async def chat_stream(
                     if final_file_ids:
                         track_thread_files(thread_id_primary, final_file_ids)
                     
-                    add_message(thread_id_primary, "user", final_message, file_ids=final_file_ids if final_file_ids else None)
-                    
                     yield f"data: {json.dumps({'type': 'routing', 'strategy': 'consult_then_decide', 'primary_label': label, 'reviewer_label': top2_label, 'confidence': confidence})}\n\n"
                     
                     # Stream primary response
                     primary_answer = ""
                     primary_bullets = []
-                    for chunk in run_assistant_stream(thread_id_primary, primary_assistant_id):
+                    for chunk in run_assistant_stream(thread_id_primary, primary_assistant_id, additional_messages=[user_message(final_message, final_file_ids)]):
                         if chunk.get("type") == "text_delta":
                             primary_answer = chunk.get("accumulated", "")
                         elif chunk.get("type") == "done":
@@ -990,10 +971,8 @@ Please provide a "Devil's Advocate" critique from a {top2_label} perspective. Sp
 
 Be constructive and specific. Focus on adding value, not just criticizing."""
                     
-                    add_message(thread_id_reviewer, "user", critique_prompt, file_ids=final_file_ids if final_file_ids else None)
-                    
                     # Stream reviewer response
-                    for chunk in run_assistant_stream(thread_id_reviewer, reviewer_assistant_id):
+                    for chunk in run_assistant_stream(thread_id_reviewer, reviewer_assistant_id, additional_messages=[user_message(critique_prompt, final_file_ids)]):
                         chunk["routing"] = routing
                         chunk["phase"] = "reviewer"
                         yield f"data: {json.dumps(chunk)}\n\n"
@@ -1020,11 +999,9 @@ Be constructive and specific. Focus on adding value, not just criticizing."""
                     if final_file_ids:
                         track_thread_files(thread_id, final_file_ids)
                     
-                    add_message(thread_id, "user", final_message, file_ids=final_file_ids if final_file_ids else None)
-                    
                     yield f"data: {json.dumps({'type': 'routing', 'strategy': 'winner_take_all', 'label': label, 'confidence': confidence})}\n\n"
                     
-                    for chunk in run_assistant_stream(thread_id, primary_assistant_id):
+                    for chunk in run_assistant_stream(thread_id, primary_assistant_id, additional_messages=[user_message(final_message, final_file_ids)]):
                         chunk["routing"] = routing
                         yield f"data: {json.dumps(chunk)}\n\n"
                         
@@ -1047,12 +1024,10 @@ Be constructive and specific. Focus on adding value, not just criticizing."""
                     if final_file_ids:
                         track_thread_files(thread_id_primary, final_file_ids)
                     
-                    add_message(thread_id_primary, "user", final_message, file_ids=final_file_ids if final_file_ids else None)
-                    
                     yield f"data: {json.dumps({'type': 'routing', 'strategy': 'parallel_ensemble', 'primary_label': label, 'reviewer_label': top2_label, 'confidence': confidence})}\n\n"
                     
                     # Stream primary response
-                    for chunk in run_assistant_stream(thread_id_primary, primary_assistant_id):
+                    for chunk in run_assistant_stream(thread_id_primary, primary_assistant_id, additional_messages=[user_message(final_message, final_file_ids)]):
                         chunk["routing"] = routing
                         chunk["phase"] = "primary"
                         yield f"data: {json.dumps(chunk)}\n\n"
@@ -1068,9 +1043,8 @@ Be constructive and specific. Focus on adding value, not just criticizing."""
                     
                     # Stream reviewer response (independent answer)
                     thread_id_reviewer = _get_or_create_thread(top2_label)
-                    add_message(thread_id_reviewer, "user", final_message, file_ids=final_file_ids if final_file_ids else None)
                     
-                    for chunk in run_assistant_stream(thread_id_reviewer, reviewer_assistant_id):
+                    for chunk in run_assistant_stream(thread_id_reviewer, reviewer_assistant_id, additional_messages=[user_message(final_message, final_file_ids)]):
                         chunk["routing"] = routing
                         chunk["phase"] = "reviewer"
                         yield f"data: {json.dumps(chunk)}\n\n"
@@ -1,61 +1,148 @@
 import os
 import re
+import copy
 import json
-import io
-import base64
-import mimetypes
-from openai import OpenAI
-from typing import Dict, Any, List, Generator, Optional
+import mmap
+import hashlib
+import threading
+import time
+from binascii import b2a_base64
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from cachetools import LRUCache, TTLCache
+from openai import AsyncOpenAI, OpenAI
+from typing import Dict, Any, List, BinaryIO, Generator, Optional, Tuple, Union
+
+# Parse model JSON with orjson when available (faster, especially on non-ASCII answers).
+# orjson is optional; fall back to the stdlib parser.
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
+
+# Read once at import; callers load .env before importing this module.
+_API_KEY = os.getenv("OPENAI_API_KEY")
+_MODEL = os.getenv("OPENAI_MODEL", "gpt-4.1")
+# Recovering citations from run steps costs an extra round trip per uncited answer and
+# rarely finds anything the message annotations didn't, so it is opt-in.
+_STEPS_FALLBACK = os.getenv("FOUNDER_RUN_STEPS_FALLBACK", "0") == "1"
+# Reuse answers to repeated questions (see "Response cache" below); FOUNDER_ANSWER_CACHE=0 disables.
+_ANSWER_CACHE = os.getenv("FOUNDER_ANSWER_CACHE", "1") != "0"
 
 _client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+# Shared HTTP pool for every OpenAI call in this process. A larger keepalive pool
+# (and HTTP/2) lets concurrent requests reuse TLS connections instead of re-handshaking.
+_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=64, max_connections=128)
+_HTTP_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
 
 def get_client():
+    # Fast path is a single global read; the locked build only runs on first use.
+    return _client or _init_client()
+
+def _init_client():
     global _client
-    if _client is None:
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise RuntimeError("OPENAI_API_KEY missing")
-        _client = OpenAI(api_key=api_key)
+    with _client_lock:
+        # Re-check under the lock so concurrent first calls build only one client
+        if _client is None:
+            if not _API_KEY:
+                raise RuntimeError("OPENAI_API_KEY missing")
+            http_client = httpx.Client(http2=True, limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT)
+            _client = OpenAI(api_key=_API_KEY, http_client=http_client)
     return _client
 
+def get_async_client():
+    """
+    Async counterpart of get_client() for code running on the server's event loop.
+    Shares the connection limits, but owns its own pool (httpx pools are per client).
+    """
+    return _async_client or _init_async_client()
+
+def _init_async_client():
+    global _async_client
+    with _client_lock:
+        if _async_client is None:
+            if not _API_KEY:
+                raise RuntimeError("OPENAI_API_KEY missing")
+            http_client = httpx.AsyncClient(http2=True, limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT)
+            _async_client = AsyncOpenAI(api_key=_API_KEY, http_client=http_client)
+    return _async_client
+
 def get_model():
-    return os.getenv("OPENAI_MODEL", "gpt-4.1")
+    return _MODEL
 
 # ---------------- Vector Stores (beta) ----------------
 
 def create_vector_store(name: str):
     return get_client().beta.vector_stores.create(name=name)
 
-def upload_files_batch_to_vs(vector_store_id: str, file_paths: list[str]):
+def _map_file(path: str):
+    """
+    Read-only memory map of a file so the HTTP layer streams straight from the
+    page cache instead of copying the whole file into a Python buffer first.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""  # mmap can't map empty files
+        # The map holds its own reference to the file, so the handle can close here.
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def upload_files_batch_to_vs(vector_store_id: str, file_paths: list[str], max_concurrency: int = 8):
+    """
+    Upload files into a vector store as one batch.
+    The SDK uploads the files in parallel (max_concurrency at a time), then
+    attaches them all to the vector store and polls until the batch settles.
+    """
     client = get_client()
-    files = [open(p, "rb") for p in file_paths]
+    # Open and map the files in parallel so slow disks (NFS, overlayfs) don't serialize
+    # the setup before the first byte is uploaded.
+    mapped = [_IO_POOL.submit(_map_file, p) for p in file_paths]
     try:
+        files = [(os.path.basename(p), m.result()) for p, m in zip(file_paths, mapped)]
         batch = client.beta.vector_stores.file_batches.upload_and_poll(
             vector_store_id=vector_store_id,
             files=files,
+            max_concurrency=max_concurrency,
         )
         return batch
     finally:
-        for f in files:
+        for m in mapped:
             try:
-                f.close()
+                content = m.result()
+                if isinstance(content, mmap.mmap):
+                    content.close()
             except Exception:
                 pass
 
 # ---------------- Assistants / Threads (beta) ----------------
 
+# Tool specs are immutable, so build them once. Callers pass a shallow list() copy
+# in case the SDK mutates the list it is given.
+_TOOLS_FS = ({"type": "file_search"},)
+_TOOLS_CI = ({"type": "code_interpreter"},)  # code_interpreter for founder analytics and calculations
+_TOOLS_FS_CI = _TOOLS_FS + _TOOLS_CI
+
+_ADVISOR_NAMES = {
+    "tech": "TechAdvisor",
+    "marketing": "MarketingAdvisor",
+    "investor": "InvestorAdvisor"
+}
+
+def _tool_resources(vector_store_id: str) -> Dict[str, Any]:
+    return {"file_search": {"vector_store_ids": [vector_store_id]}}
+
 def create_assistant(name: str, vector_store_id: str):
     """Legacy function for single assistant. Use create_specialized_assistant instead."""
     client = get_client()
     return client.beta.assistants.create(
         name=name,
         model=get_model(),
-        instructions=_get_assistant_instructions(),
-        tools=[
-            {"type": "file_search"},
-            {"type": "code_interpreter"}  # For founder analytics and calculations
-        ],
-        tool_resources={"file_search": {"vector_store_ids": [vector_store_id]}},
+        instructions=_ASSISTANT_INSTRUCTIONS,
+        tools=list(_TOOLS_FS_CI),
+        tool_resources=_tool_resources(vector_store_id),
     )
 
 def create_specialized_assistant(label: str, vector_store_id: str, enable_code_interpreter: bool = False):
@@ -69,149 +156,157 @@ def create_specialized_assistant(label: str, vector_store_id: str, enable_code_i
     """
     client = get_client()
     instructions = _get_specialized_instructions(label)
-    tools = [{"type": "file_search"}]
-    
-    if enable_code_interpreter:
-        tools.append({"type": "code_interpreter"})
-    
-    name_map = {
-        "tech": "TechAdvisor",
-        "marketing": "MarketingAdvisor",
-        "investor": "InvestorAdvisor"
-    }
+    tools = list(_TOOLS_FS_CI if enable_code_interpreter else _TOOLS_FS)
     
     return client.beta.assistants.create(
-        name=name_map.get(label, f"{label.capitalize()}Advisor"),
+        name=_ADVISOR_NAMES.get(label, f"{label.capitalize()}Advisor"),
         model=get_model(),
         instructions=instructions,
         tools=tools,
-        tool_resources={"file_search": {"vector_store_ids": [vector_store_id]}},
+        tool_resources=_tool_resources(vector_store_id),
     )
 
+# Instructions are fixed strings, identical on every create/update and never passed per
+# run, so the system-prompt prefix stays byte-identical and OpenAI's prompt cache can reuse
+# it across requests. Per-turn context (product cards, critique prompts) belongs in the user
+# message, never here.
+_ASSISTANT_INSTRUCTIONS = (
+    "You are a YC-style startup advisor. "
+    "IMPORTANT: You MUST use the file_search tool to retrieve information from the knowledge base "
+    "for EVERY user question, even if you think you know the answer. "
+    "Always search the vector store first before responding. "
+    "Use the retrieval tool on the attached vector store to provide concrete, actionable guidance and cite snippets when helpful. "
+    "When possible, produce a JSON object with keys: "
+    "`answer` (string) and `bullets` (array of strings). "
+    "If you cite specifics, reference them inline and expect the system to attach sources. "
+    "For founder analytics questions involving calculations, data analysis, financial projections, or visualizations, "
+    "use the code_interpreter tool to run Python code. This is especially useful for: "
+    "- Calculating metrics (burn rate, runway, growth rates, etc.) "
+    "- Analyzing financial data and projections "
+    "- Creating charts and visualizations "
+    "- Performing statistical analysis "
+    "- Modeling scenarios and what-if analyses."
+)
+
 def _get_assistant_instructions():
     """Get the assistant instructions that enforce file_search usage and enable code_interpreter for analytics."""
-    return (
-        "You are a YC-style startup advisor. "
-        "IMPORTANT: You MUST use the file_search tool to retrieve information from the knowledge base "
-        "for EVERY user question, even if you think you know the answer. "
-        "Always search the vector store first before responding. "
-        "Use the retrieval tool on the attached vector store to provide concrete, actionable guidance and cite snippets when helpful. "
-        "When possible, produce a JSON object with keys: "
-        "`answer` (string) and `bullets` (array of strings). "
-        "If you cite specifics, reference them inline and expect the system to attach sources. "
-        "For founder analytics questions involving calculations, data analysis, financial projections, or visualizations, "
-        "use the code_interpreter tool to run Python code. This is especially useful for: "
-        "- Calculating metrics (burn rate, runway, growth rates, etc.) "
-        "- Analyzing financial data and projections "
-        "- Creating charts and visualizations "
-        "- Performing statistical analysis "
-        "- Modeling scenarios and what-if analyses."
-    )
+    return _ASSISTANT_INSTRUCTIONS
+
+_BASE_INSTRUCTIONS = (
+    "IMPORTANT: You MUST use the file_search tool to retrieve information from the knowledge base "
+    "for EVERY user question, even if you think you know the answer. "
+    "Always search the vector store first before responding. "
+    "Use the retrieval tool on the attached vector store to provide concrete, actionable guidance and cite snippets when helpful. "
+    "When possible, produce a JSON object with keys: "
+    "`answer` (string) and `bullets` (array of strings). "
+    "If you cite specifics, reference them inline and expect the system to attach sources. "
+)
+
+_TECH_INSTRUCTIONS = _BASE_INSTRUCTIONS + (
+    "You are TechAdvisor, a YC-style technical advisor specializing in: "
+    "- System architecture and scalability "
+    "- AI/ML product patterns and model deployment "
+    "- Infrastructure, databases, APIs, and tech stack decisions "
+    "- Performance optimization and security "
+    "- DevOps, CI/CD, and deployment strategies "
+    "\n\n"
+    "SCOPE ENFORCEMENT: If asked about fundraising, pitch decks, KPIs, or investor relations, "
+    "briefly acknowledge the question and defer: 'This is better handled by InvestorAdvisor. "
+    "For marketing, growth, or launch strategy questions, defer to MarketingAdvisor.' "
+    "Then provide what technical insights you can from your domain. "
+    "\n\n"
+    "For technical calculations or quick computations, you may use code_interpreter if needed."
+)
+
+_MARKETING_INSTRUCTIONS = _BASE_INSTRUCTIONS + (
+    "You are MarketingAdvisor, a YC-style marketing and growth advisor specializing in: "
+    "- Launch strategy and go-to-market plans "
+    "- Growth tactics and customer acquisition "
+    "- Copywriting, messaging, and brand positioning "
+    "- Content strategy, SEO, and distribution channels "
+    "- Conversion optimization and funnel design "
+    "\n\n"
+    "SCOPE ENFORCEMENT: If asked about technical architecture, system design, or AI/ML models, "
+    "briefly defer: 'This is better handled by TechAdvisor.' "
+    "If asked about fundraising, pitch decks, KPIs, or investor relations, "
+    "briefly defer: 'This is better handled by InvestorAdvisor.' "
+    "Then provide what marketing insights you can from your domain."
+)
+
+_INVESTOR_INSTRUCTIONS = _BASE_INSTRUCTIONS + (
+    "You are InvestorAdvisor, a YC-style fundraising and investor relations advisor specializing in: "
+    "- Fundraising strategy and investor relations "
+    "- Pitch deck creation and presentation "
+    "- KPIs, financial metrics, and unit economics "
+    "- Valuation, term sheets, and cap table management "
+    "- Financial modeling and projections "
+    "\n\n"
+    "SCOPE ENFORCEMENT: If asked about technical architecture or system design, "
+    "briefly defer: 'This is better handled by TechAdvisor.' "
+    "If asked about marketing, growth, or launch strategy (unless related to investor pitch), "
+    "briefly defer: 'This is better handled by MarketingAdvisor.' "
+    "Then provide what investor/financial insights you can from your domain. "
+    "\n\n"
+    "For financial calculations, data analysis, financial projections, or visualizations, "
+    "use the code_interpreter tool to run Python code. This is especially useful for: "
+    "- Calculating metrics (burn rate, runway, growth rates, CAC, LTV, etc.) "
+    "- Analyzing financial data and projections "
+    "- Creating charts and visualizations "
+    "- Performing statistical analysis "
+    "- Modeling scenarios and what-if analyses."
+)
+
+_SPECIALIZED_INSTRUCTIONS = {
+    "tech": _TECH_INSTRUCTIONS,
+    "marketing": _MARKETING_INSTRUCTIONS,
+    "investor": _INVESTOR_INSTRUCTIONS,
+}
 
 def _get_specialized_instructions(label: str) -> str:
     """Get specialized instructions for each assistant type."""
-    base = (
-        "IMPORTANT: You MUST use the file_search tool to retrieve information from the knowledge base "
-        "for EVERY user question, even if you think you know the answer. "
-        "Always search the vector store first before responding. "
-        "Use the retrieval tool on the attached vector store to provide concrete, actionable guidance and cite snippets when helpful. "
-        "When possible, produce a JSON object with keys: "
-        "`answer` (string) and `bullets` (array of strings). "
-        "If you cite specifics, reference them inline and expect the system to attach sources. "
-    )
-    
-    if label == "tech":
-        return (
-            base +
-            "You are TechAdvisor, a YC-style technical advisor specializing in: "
-            "- System architecture and scalability "
-            "- AI/ML product patterns and model deployment "
-            "- Infrastructure, databases, APIs, and tech stack decisions "
-            "- Performance optimization and security "
-            "- DevOps, CI/CD, and deployment strategies "
-            "\n\n"
-            "SCOPE ENFORCEMENT: If asked about fundraising, pitch decks, KPIs, or investor relations, "
-            "briefly acknowledge the question and defer: 'This is better handled by InvestorAdvisor. "
-            "For marketing, growth, or launch strategy questions, defer to MarketingAdvisor.' "
-            "Then provide what technical insights you can from your domain. "
-            "\n\n"
-            "For technical calculations or quick computations, you may use code_interpreter if needed."
-        )
-    elif label == "marketing":
-        return (
-            base +
-            "You are MarketingAdvisor, a YC-style marketing and growth advisor specializing in: "
-            "- Launch strategy and go-to-market plans "
-            "- Growth tactics and customer acquisition "
-            "- Copywriting, messaging, and brand positioning "
-            "- Content strategy, SEO, and distribution channels "
-            "- Conversion optimization and funnel design "
-            "\n\n"
-            "SCOPE ENFORCEMENT: If asked about technical architecture, system design, or AI/ML models, "
-            "briefly defer: 'This is better handled by TechAdvisor.' "
-            "If asked about fundraising, pitch decks, KPIs, or investor relations, "
-            "briefly defer: 'This is better handled by InvestorAdvisor.' "
-            "Then provide what marketing insights you can from your domain."
-        )
-    elif label == "investor":
-        return (
-            base +
-            "You are InvestorAdvisor, a YC-style fundraising and investor relations advisor specializing in: "
-            "- Fundraising strategy and investor relations "
-            "- Pitch deck creation and presentation "
-            "- KPIs, financial metrics, and unit economics "
-            "- Valuation, term sheets, and cap table management "
-            "- Financial modeling and projections "
-            "\n\n"
-            "SCOPE ENFORCEMENT: If asked about technical architecture or system design, "
-            "briefly defer: 'This is better handled by TechAdvisor.' "
-            "If asked about marketing, growth, or launch strategy (unless related to investor pitch), "
-            "briefly defer: 'This is better handled by MarketingAdvisor.' "
-            "Then provide what investor/financial insights you can from your domain. "
-            "\n\n"
-            "For financial calculations, data analysis, financial projections, or visualizations, "
-            "use the code_interpreter tool to run Python code. This is especially useful for: "
-            "- Calculating metrics (burn rate, runway, growth rates, CAC, LTV, etc.) "
-            "- Analyzing financial data and projections "
-            "- Creating charts and visualizations "
-            "- Performing statistical analysis "
-            "- Modeling scenarios and what-if analyses."
-        )
-    else:
-        return base
+    return _SPECIALIZED_INSTRUCTIONS.get(label, _BASE_INSTRUCTIONS)
 
 def update_assistant(assistant_id: str, vector_store_id: str):
     """Update an existing assistant with new instructions."""
     client = get_client()
     return client.beta.assistants.update(
         assistant_id=assistant_id,
-        instructions=_get_assistant_instructions(),
-        tools=[
-            {"type": "file_search"},
-            {"type": "code_interpreter"}  # For founder analytics and calculations
-        ],
-        tool_resources={"file_search": {"vector_store_ids": [vector_store_id]}},
+        instructions=_ASSISTANT_INSTRUCTIONS,
+        tools=list(_TOOLS_FS_CI),
+        tool_resources=_tool_resources(vector_store_id),
     )
 
 def create_thread():
     return get_client().beta.threads.create()
 
-def upload_file(file_content: bytes, filename: str, purpose: str = "assistants"):
+def upload_file(file_content: Union[bytes, BinaryIO], filename: str, purpose: str = "assistants"):
     """
     Upload a file to OpenAI for use with assistants.
+    file_content may be bytes or a binary file object (e.g. the spooled temp file behind
+    a FastAPI UploadFile), which is streamed from its current position without being
+    read into memory first.
     Returns the file object with file_id.
     """
     client = get_client()
-    # Create a file-like object from bytes
-    file_obj = io.BytesIO(file_content)
-    file_obj.name = filename
-    
+    # The SDK takes a (filename, bytes-or-file) tuple directly; the multipart layer guesses
+    # the content type from the filename, so there is no need to wrap the content.
     file = client.files.create(
-        file=file_obj,
+        file=(filename, file_content),
         purpose=purpose
     )
     return file
 
+async def upload_file_async(file_content: Union[bytes, BinaryIO], filename: str, purpose: str = "assistants"):
+    """
+    Async variant of upload_file for FastAPI handlers, so several uploads can be
+    awaited together without tying up the event loop.
+    """
+    client = get_async_client()
+    return await client.files.create(
+        file=(filename, file_content),
+        purpose=purpose
+    )
+
 def add_message(thread_id: str, role: str, content: str, file_ids: List[str] = None):
     """
     Add a message to a thread, optionally with file attachments.
@@ -234,13 +329,29 @@ def add_message(thread_id: str, role: str, content: str, file_ids: List[str] = N
     # If file_ids are provided, attach them using the attachments parameter
     # This is the correct way to attach files for code_interpreter
     if file_ids:
-        message_params["attachments"] = [
-            {"file_id": file_id, "tools": [{"type": "code_interpreter"}]}
-            for file_id in file_ids
-        ]
+        message_params["attachments"] = _code_interpreter_attachments(file_ids)
     
     return client.beta.threads.messages.create(**message_params)
 
+def user_message(content: str, file_ids: List[str] = None) -> Dict[str, Any]:
+    """
+    Build a user message for the run functions' additional_messages argument.
+    The run-create request then adds it to the thread itself, saving the separate
+    add_message() round trip. file_ids are attached for code_interpreter.
+    """
+    message = {"role": "user", "content": content}
+    if file_ids:
+        message["attachments"] = _code_interpreter_attachments(file_ids)
+    return message
+
+def _code_interpreter_attachments(file_ids: List[str]) -> List[Dict[str, Any]]:
+    ci_tools = list(_TOOLS_CI)  # one copy per call, shared by every attachment
+    return [{"file_id": file_id, "tools": ci_tools} for file_id in file_ids]
+
+def _field(obj, name: str):
+    """Read a field from an SDK model or a plain dict without converting the whole tree."""
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
 def _extract_text_and_citations(message) -> Dict[str, Any]:
     """
     From an Assistant message, return:
@@ -252,297 +363,366 @@ def _extract_text_and_citations(message) -> Dict[str, Any]:
     citations: List[Dict[str, str]] = []
     images: List[Dict[str, str]] = []
 
-    # Get message content - try multiple access methods
-    content = []
-    if hasattr(message, "content"):
-        content = message.content or []
-    elif hasattr(message, "model_dump"):
-        # Pydantic model - convert to dict
-        msg_dict = message.model_dump()
-        content = msg_dict.get("content", [])
-    elif isinstance(message, dict):
-        content = message.get("content", [])
-    
-    for part in content:
-        # Handle both object and dict representations
-        part_type = None
-        if hasattr(part, "type"):
-            part_type = part.type
-        elif isinstance(part, dict):
-            part_type = part.get("type")
-        
+    # SDK messages are Pydantic models; read fields in place rather than model_dump()ing
+    # the whole tree, which would copy the full text and every annotation.
+    for part in _field(message, "content") or []:
+        part_type = _field(part, "type")
+
         # Handle image_file content (from code_interpreter visualizations)
         if part_type == "image_file":
-            image_file_obj = None
-            if hasattr(part, "image_file"):
-                image_file_obj = part.image_file
-            elif isinstance(part, dict):
-                image_file_obj = part.get("image_file")
-            
-            if image_file_obj:
-                file_id = None
-                if hasattr(image_file_obj, "file_id"):
-                    file_id = image_file_obj.file_id
-                elif isinstance(image_file_obj, dict):
-                    file_id = image_file_obj.get("file_id")
-                
-                if file_id:
-                    images.append({"file_id": file_id})
+            file_id = _field(_field(part, "image_file"), "file_id")
+            if file_id:
+                images.append({"file_id": file_id})
             continue
-        
+
         if part_type != "text":
             continue
-        
-        # Get text object
-        text_obj = None
-        if hasattr(part, "text"):
-            text_obj = part.text
-        elif isinstance(part, dict):
-            text_obj = part.get("text")
-        
-        if not text_obj:
-            continue
-            
-        # Extract text value
-        txt = ""
-        if hasattr(text_obj, "value"):
-            txt = text_obj.value or ""
-        elif isinstance(text_obj, dict):
-            txt = text_obj.get("value", "") or ""
-        
+
+        text_obj = _field(part, "text")
+        txt = _field(text_obj, "value") or ""
         if txt:
             text_parts.append(txt)
 
         # Parse annotations for file citations
-        # Annotations are on text_obj.annotations
-        anns = []
-        if hasattr(text_obj, "annotations"):
-            anns = text_obj.annotations or []
-        elif isinstance(text_obj, dict):
-            anns = text_obj.get("annotations", []) or []
-        
-        for a in anns:
-            # Get annotation type - try multiple access methods
-            ann_type = None
-            if hasattr(a, "type"):
-                ann_type = a.type
-            elif isinstance(a, dict):
-                ann_type = a.get("type")
-            elif hasattr(a, "model_dump"):
-                # Pydantic model
-                a_dict = a.model_dump()
-                ann_type = a_dict.get("type")
-            
-            # Also try to get type from __dict__ if it exists
-            if not ann_type and hasattr(a, "__dict__"):
-                ann_type = a.__dict__.get("type")
-            
-            if ann_type == "file_citation":
-                # Get file_citation object - try multiple access methods
-                fc = None
-                if hasattr(a, "file_citation"):
-                    fc = a.file_citation
-                elif isinstance(a, dict):
-                    fc = a.get("file_citation")
-                elif hasattr(a, "model_dump"):
-                    a_dict = a.model_dump()
-                    fc = a_dict.get("file_citation")
-                
-                # Also try __dict__ access
-                if not fc and hasattr(a, "__dict__"):
-                    fc = a.__dict__.get("file_citation")
-                
-                if fc:
-                    # Extract file_id - try multiple ways
-                    file_id = None
-                    if hasattr(fc, "file_id"):
-                        file_id = fc.file_id
-                    elif isinstance(fc, dict):
-                        file_id = fc.get("file_id")
-                    elif hasattr(fc, "model_dump"):
-                        fc_dict = fc.model_dump()
-                        file_id = fc_dict.get("file_id")
-                    
-                    # Also try __dict__ access
-                    if not file_id and hasattr(fc, "__dict__"):
-                        file_id = fc.__dict__.get("file_id")
-                    
-                    if file_id:
-                        # Extract quote if available
-                        quote = ""
-                        if hasattr(fc, "quote"):
-                            quote = getattr(fc, "quote", "") or ""
-                        elif isinstance(fc, dict):
-                            quote = fc.get("quote", "") or ""
-                        elif hasattr(fc, "model_dump"):
-                            fc_dict = fc.model_dump()
-                            quote = fc_dict.get("quote", "") or ""
-                        
-                        # Also try __dict__ access
-                        if not quote and hasattr(fc, "__dict__"):
-                            quote = fc.__dict__.get("quote", "") or ""
-                        
-                        citations.append({
-                            "file_id": file_id,
-                            "quote": quote or ""
-                        })
+        for a in _field(text_obj, "annotations") or []:
+            if _field(a, "type") != "file_citation":
+                continue
+            fc = _field(a, "file_citation")
+            file_id = _field(fc, "file_id")
+            if file_id:
+                citations.append({
+                    "file_id": file_id,
+                    "quote": _field(fc, "quote") or ""
+                })
+
+    # Most messages have a single text part; skip the join for it
+    if len(text_parts) == 1:
+        text = text_parts[0].strip()
+    elif text_parts:
+        text = "\n".join(text_parts).strip()
+    else:
+        text = ""
 
     return {
-        "text": "\n".join(text_parts).strip(),
+        "text": text,
         "citations": citations,
         "images": images
     }
 
+# File metadata never changes, so results (including failed lookups, as "") are kept
+# for the life of the process. Only the filename is needed (sources show it; images are
+# always PNG), so that is all that is stored. Shared by the sync and async lookups.
+_FILE_METADATA_CACHE = LRUCache(maxsize=4096)
+_FILE_METADATA_LOCK = threading.Lock()
+
+def _metadata_from_file(f) -> str:
+    # SDK returns fields like f.id, f.filename
+    return getattr(f, "filename", None) or ""
+
+def _cached_file_metadata(file_id: str) -> Optional[str]:
+    with _FILE_METADATA_LOCK:
+        return _FILE_METADATA_CACHE.get(file_id)
+
+def _cache_file_metadata(file_id: str, meta: str):
+    with _FILE_METADATA_LOCK:
+        _FILE_METADATA_CACHE[file_id] = meta
+
+def _file_metadata(file_id: str) -> str:
+    """
+    Retrieve file metadata once per file_id: the filename ("" if unknown).
+    """
+    meta = _cached_file_metadata(file_id)
+    if meta is None:
+        try:
+            meta = _metadata_from_file(get_client().files.retrieve(file_id))
+        except Exception:
+            meta = ""
+        _cache_file_metadata(file_id, meta)
+    return meta
+
+async def _afile_metadata(file_id: str) -> str:
+    """Async variant of _file_metadata(); shares its cache."""
+    meta = _cached_file_metadata(file_id)
+    if meta is None:
+        try:
+            meta = _metadata_from_file(await get_async_client().files.retrieve(file_id))
+        except Exception:
+            meta = ""
+        _cache_file_metadata(file_id, meta)
+    return meta
+
 def _filename_for_file_id(file_id: str) -> str:
     """
     Retrieve file metadata to get the original filename.
     """
+    return _file_metadata(file_id) or file_id
+
+def _cached_filenames(file_ids) -> Tuple[Dict[str, str], List[str]]:
+    """Split unique file_ids into ({file_id: filename} for cached ones, [uncached ids])."""
+    names: Dict[str, str] = {}
+    misses: List[str] = []
+    for fid in dict.fromkeys(file_ids):
+        meta = _cached_file_metadata(fid)
+        if meta is None:
+            misses.append(fid)
+        else:
+            names[fid] = meta or fid
+    return names, misses
+
+def _sources_with_filenames(citations: List[Dict[str, str]], id_to_name: Dict[str, str]) -> List[Dict[str, str]]:
+    return [
+        {
+            "file_id": c["file_id"],
+            "filename": id_to_name[c["file_id"]],
+            "quote": c.get("quote", "")
+        }
+        for c in citations
+    ]
+
+# Image downloads are read in chunks that are a multiple of 3 bytes, so each one
+# base64-encodes on its own (no padding mid-stream).
+_IMAGE_CHUNK_SIZE = 57 * 1024
+
+class _ImageDataUrl:
+    """
+    Builds a data URL by base64-encoding an image as it downloads, so the raw bytes
+    are never held in full next to their encoding.
+    """
+
+    def __init__(self):
+        # code_interpreter renders charts as PNG, so no metadata lookup is needed for the type.
+        self._buf = bytearray(b"data:image/png;base64,")
+        self._carry = b""
+
+    def feed(self, chunk: bytes) -> None:
+        if self._carry:
+            chunk = self._carry + chunk
+        cut = len(chunk) - len(chunk) % 3
+        # b2a_base64 is the C encoder under base64.b64encode, called directly
+        self._buf += b2a_base64(memoryview(chunk)[:cut], newline=False)
+        self._carry = chunk[cut:]
+
+    def payload(self, file_id: str) -> Dict[str, str]:
+        self._buf += b2a_base64(self._carry, newline=False)
+        # The URL is pure ASCII, which decodes faster than UTF-8
+        return {"file_id": file_id, "data_url": self._buf.decode("ascii")}
+
+def _image_data_url(file_id: str) -> Optional[Dict[str, str]]:
+    """Download one image file and return it as {file_id, data_url}, or None on failure."""
+    encoder = _ImageDataUrl()
     try:
-        f = get_client().files.retrieve(file_id)
-        # SDK returns fields like f.id, f.filename
-        return getattr(f, "filename", file_id)
+        with get_client().files.with_streaming_response.content(file_id) as response:
+            for chunk in response.iter_bytes(_IMAGE_CHUNK_SIZE):
+                encoder.feed(chunk)
     except Exception:
-        return file_id
+        return None
+    return encoder.payload(file_id)
+
+async def _aimage_data_url(file_id: str) -> Optional[Dict[str, str]]:
+    """Async variant of _image_data_url()."""
+    encoder = _ImageDataUrl()
+    try:
+        async with get_async_client().files.with_streaming_response.content(file_id) as response:
+            async for chunk in response.iter_bytes(_IMAGE_CHUNK_SIZE):
+                encoder.feed(chunk)
+    except Exception:
+        return None
+    return encoder.payload(file_id)
+
+def _enrich_sources_and_images(citations: List[Dict[str, str]],
+                               images: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+    """
+    Attach filenames to citations and download images (from code_interpreter) as
+    base64 data URLs, in one fan-out: filename lookups and image downloads are all
+    queued before waiting on any of them. Cached filenames are answered inline, and a
+    single lookup or download runs inline too, so the pool is only used when there is
+    more than one round trip to overlap. Images that fail to download are skipped.
+    """
+    id_to_name, misses = _cached_filenames(c["file_id"] for c in citations)
+    image_ids = [img["file_id"] for img in images if img.get("file_id")]
+    if len(misses) + len(image_ids) > 1:
+        names = _IO_POOL.map(_filename_for_file_id, misses)
+        image_results = _IO_POOL.map(_image_data_url, image_ids)
+    else:
+        names = map(_filename_for_file_id, misses)
+        image_results = map(_image_data_url, image_ids)
+    id_to_name.update(zip(misses, names))
+    sources = _sources_with_filenames(citations, id_to_name)
+    return sources, [r for r in image_results if r]
 
 def _dedupe_sources(sources: List[Dict[str, str]]) -> List[Dict[str, str]]:
-    seen = set()
-    out = []
+    # dicts keep insertion order, so the first occurrence of each (file_id, quote) wins
+    unique: Dict[tuple, Dict[str, str]] = {}
     for s in sources:
-        key = (s.get("file_id"), s.get("quote"))
-        if key not in seen:
-            seen.add(key)
-            out.append(s)
-    return out
+        unique.setdefault((s.get("file_id"), s.get("quote")), s)
+    return list(unique.values())
+
+# Matches 【number:number†filename】 or similar citation markers
+# Examples: 【4:0†yc_do_things_dont_scale.md】, 【1:2†file.txt】
+_CITATION_RE = re.compile(r'【[^】]+】')
 
 def _clean_citation_markers(text: str) -> str:
     """
     Remove citation markers like 【4:0†filename.md】 from text.
     These markers are added by OpenAI when file_search is used.
     """
-    # Pattern matches 【number:number†filename】 or similar citation markers
-    # Examples: 【4:0†yc_do_things_dont_scale.md】, 【1:2†file.txt】
-    pattern = r'【[^】]+】'
-    cleaned = re.sub(pattern, '', text)
-    return cleaned.strip()
+    # Most strings (bullets, stream deltas) have no markers; a substring test is far
+    # cheaper than a regex scan.
+    if "【" in text:
+        text = _CITATION_RE.sub('', text)
+    return text.strip()
 
-def _extract_answer_from_incomplete_json(text: str) -> Optional[str]:
+class _CitationCleaner:
     """
-    Try to extract the answer field from JSON, even if the JSON is incomplete.
-    This is useful during streaming when JSON might not be fully formed yet.
+    Incremental _clean_citation_markers for streamed text. Each delta is cleaned on its
+    own and appended to `text`; a marker split across deltas is held back until its
+    closing bracket arrives, so the whole buffer never needs re-cleaning.
     """
-    if not text:
-        return None
-    
-    cleaned = _clean_citation_markers(text)
-    trimmed = cleaned.strip()
-    
-    # If it doesn't look like JSON, return None
-    if not (trimmed.startswith('{') or '"answer"' in trimmed or "'answer'" in trimmed):
-        return None
-    
-    # Try to find "answer" field and extract its value
-    # Look for "answer": "value" pattern
-    # Handle both complete and incomplete JSON
-    
-    # Approach 1: Try to find complete JSON object
-    try:
-        # Find the first { and try to match braces
-        start_idx = trimmed.find('{')
-        if start_idx >= 0:
-            brace_count = 0
-            end_idx = start_idx
-            for i in range(start_idx, len(trimmed)):
-                if trimmed[i] == '{':
-                    brace_count += 1
-                elif trimmed[i] == '}':
-                    brace_count -= 1
-                    if brace_count == 0:
-                        end_idx = i
+    _MAX_PENDING = 256  # Real markers are short; a longer unclosed "【" is just text
+
+    def __init__(self):
+        self.text = ""
+        self._pending = ""
+
+    def feed(self, delta: str) -> str:
+        """Clean one delta and return the text it adds (possibly empty)."""
+        text = self._pending + delta
+        self._pending = ""
+        if "【" in text:
+            text = _CITATION_RE.sub('', text)
+            # An opening bracket after the last closing one may be a marker still arriving
+            cut = text.find("【", text.rfind("】") + 1)
+            if cut != -1 and len(text) - cut < self._MAX_PENDING:
+                text, self._pending = text[:cut], text[cut:]
+        self.text += text
+        return text
+
+    def flush(self) -> str:
+        """Release text held back as a possible marker once no more deltas will arrive."""
+        text = self._pending
+        self._pending = ""
+        if text:
+            text = _CITATION_RE.sub('', text)
+            self.text += text
+        return text
+
+# JSON string escapes (plus \' for single-quoted values the model sometimes emits)
+_JSON_ESCAPES = {'"': '"', "'": "'", "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+_VALUE_STOP = {'"': re.compile(r'["\\]'), "'": re.compile(r"['\\]")}
+
+class _StreamingAnswerExtractor:
+    """
+    Incrementally pulls the "answer" string out of JSON that is still being streamed.
+
+    update() takes the whole text received so far but only scans the characters it
+    hasn't seen yet, carrying its parse state (looking for the key, the colon, the
+    opening quote, or inside the value) between calls. Following a growing buffer
+    therefore costs O(total length) instead of a full re-parse on every delta.
+    If earlier text changes (e.g. a citation marker completes and is stripped),
+    it starts over.
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._text = ""
+        self._pos = 0
+        self._state = "key"
+        self._quote = '"'
+        self._answer = ""
+
+    def update(self, text: str) -> Optional[str]:
+        """Return the answer decoded so far, or None if there is no non-blank answer yet."""
+        if not text.startswith(self._text):
+            self._reset()
+        self._text = text
+        self._scan()
+        return self._answer if self._answer.strip() else None
+
+    def _scan(self):
+        t, i, n = self._text, self._pos, len(self._text)
+        while i < n and self._state != "done":
+            if self._state == "key":
+                dq, sq = t.find('"answer"', i), t.find("'answer'", i)
+                if dq < 0 and sq < 0:
+                    i = max(i, n - 7)  # keep a tail that may be the start of a split key
+                    break
+                if dq < 0 or 0 <= sq < dq:
+                    i, self._quote = sq + 8, "'"
+                else:
+                    i, self._quote = dq + 8, '"'
+                self._state = "colon"
+            elif self._state in ("colon", "open"):
+                j = t.find(":" if self._state == "colon" else self._quote, i)
+                if j < 0:
+                    i = n
+                    break
+                i = j + 1
+                self._state = "open" if self._state == "colon" else "value"
+            else:  # inside the value: copy runs of plain text, decode escapes one at a time
+                m = _VALUE_STOP[self._quote].search(t, i)
+                if m is None:
+                    self._answer += t[i:]
+                    i = n
+                    break
+                j = m.start()
+                self._answer += t[i:j]
+                if t[j] != "\\":
+                    self._state = "done"
+                    i = j + 1
+                    break
+                if j + 1 >= n:
+                    i = j  # escape split across deltas; wait for the next one
+                    break
+                c = t[j + 1]
+                if c == "u":
+                    if j + 6 > n:
+                        i = j
                         break
-            
-            if brace_count == 0:  # Found balanced braces
-                json_str = trimmed[start_idx:end_idx + 1]
-                try:
-                    parsed = json.loads(json_str)
-                    if isinstance(parsed, dict) and "answer" in parsed:
-                        answer = parsed.get("answer")
-                        if answer and isinstance(answer, str):
-                            return answer
-                except Exception:
-                    pass
-    except Exception:
-        pass
-    
-    # Approach 2: Extract answer using manual parsing (for incomplete JSON)
-    # Find "answer": and then extract the string value, handling escaped characters
-    try:
-        # Find the position of "answer":
-        answer_key_pos = trimmed.find('"answer"')
-        if answer_key_pos == -1:
-            answer_key_pos = trimmed.find("'answer'")
-            quote_char = "'"
-        else:
-            quote_char = '"'
-        
-        if answer_key_pos >= 0:
-            # Find the colon after "answer"
-            colon_pos = trimmed.find(':', answer_key_pos)
-            if colon_pos >= 0:
-                # Find the opening quote of the value
-                value_start = trimmed.find(quote_char, colon_pos + 1)
-                if value_start >= 0:
-                    value_start += 1  # Skip the opening quote
-                    # Now find the closing quote, accounting for escaped quotes
-                    value_end = None
-                    i = value_start
-                    while i < len(trimmed):
-                        if trimmed[i] == '\\':
-                            # Skip escaped character
-                            i += 2
-                            continue
-                        elif trimmed[i] == quote_char:
-                            value_end = i
-                            break
-                        i += 1
-                    
-                    if value_end is not None and value_end > value_start:
-                        # Found complete value (with closing quote)
-                        answer_value = trimmed[value_start:value_end]
-                    elif value_start < len(trimmed):
-                        # Incomplete value (no closing quote yet) - use everything from value_start to end
-                        answer_value = trimmed[value_start:]
-                    else:
-                        answer_value = None
-                    
-                    if answer_value:
-                        # Unescape the string
-                        answer_value = answer_value.replace('\\"', '"').replace("\\'", "'")
-                        answer_value = answer_value.replace('\\n', '\n').replace('\\t', '\t').replace('\\r', '\r')
-                        answer_value = answer_value.replace('\\\\', '\\')
-                        if answer_value.strip():  # Only return if we got a non-empty value
-                            return answer_value
-    except Exception:
-        pass
-    
-    # Approach 3: Fallback to regex (for edge cases)
-    patterns = [
-        r'"answer"\s*:\s*"((?:[^"\\]|\\.)*?)"(?:\s*[,}])',
-        r"'answer'\s*:\s*'((?:[^'\\]|\\.)*?)'(?:\s*[,}])",
-        r'"answer"\s*:\s*"((?:[^"\\]|\\.)*)"',
-        r"'answer'\s*:\s*'((?:[^'\\]|\\.)*)'",
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, trimmed, re.DOTALL)
-        if match:
-            answer_value = match.group(1)
-            # Unescape the string
-            answer_value = answer_value.replace('\\"', '"').replace("\\'", "'")
-            answer_value = answer_value.replace('\\n', '\n').replace('\\t', '\t').replace('\\r', '\r')
-            answer_value = answer_value.replace('\\\\', '\\')
-            if answer_value:
-                return answer_value
-    
+                    try:
+                        self._answer += chr(int(t[j + 2:j + 6], 16))
+                        i = j + 6
+                    except ValueError:
+                        self._answer += t[j:j + 2]
+                        i = j + 2
+                else:
+                    self._answer += _JSON_ESCAPES.get(c, t[j:j + 2])
+                    i = j + 2
+        self._pos = i
+
+def _is_structured(obj) -> bool:
+    return isinstance(obj, dict) and ("answer" in obj or "bullets" in obj)
+
+_DECODER = json.JSONDecoder()
+# Only a '{' opening a quoted key can start our object. Each failed raw_decode builds a
+# JSONDecodeError that counts lines up to the failure, so trying every '{' in prose full
+# of {placeholders} would be quadratic.
+_OBJECT_START_RE = re.compile(r'\{\s*"')
+# Failed decodes still cost a scan each; a reply that hasn't shown its object after this
+# many candidates is treated as prose.
+_MAX_OBJECT_ATTEMPTS = 32
+
+def _find_structured_object(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Decode JSON objects starting at each '{"' in turn and return the first one that
+    looks like our {answer, bullets} shape. raw_decode parses in place, so there is
+    no splitting or slicing of the text.
+    """
+    match = _OBJECT_START_RE.search(text)
+    for _ in range(_MAX_OBJECT_ATTEMPTS):
+        if match is None:
+            break
+        idx = match.start()
+        try:
+            obj, end = _DECODER.raw_decode(text, idx)
+        except (ValueError, RecursionError):
+            # RecursionError: deeply nested model output; not our shape either way
+            match = _OBJECT_START_RE.search(text, idx + 1)
+            continue
+        if _is_structured(obj):
+            return obj
+        match = _OBJECT_START_RE.search(text, end)
     return None
 
 def _shape_structured_payload(text: str, sources: List[Dict[str, str]]) -> Dict[str, Any]:
@@ -553,77 +733,30 @@ def _shape_structured_payload(text: str, sources: List[Dict[str, str]]) -> Dict[
     # Clean citation markers from text first
     cleaned_text = _clean_citation_markers(text)
     
-    # 1) Attempt to parse JSON directly (either whole body or fenced)
+    # 1) Attempt to parse JSON: the whole body first (the usual case), then the first
+    # JSON object embedded anywhere in the text (code fences, prose before/after).
     candidate = cleaned_text.strip()
     parsed = None
-    
-    # Try to extract JSON from code fences first
-    if "```" in candidate:
-        try:
-            # Split by code fences and look for JSON blocks
-            parts = candidate.split("```")
-            for i, part in enumerate(parts):
-                part = part.strip()
-                # Skip language identifier (json, etc.)
-                if part.lower() in ["json"]:
-                    continue
-                # Try to parse if it looks like JSON
-                if part.startswith("{") and part.endswith("}"):
-                    try:
-                        test_parsed = json.loads(part)
-                        if isinstance(test_parsed, dict) and ("answer" in test_parsed or "bullets" in test_parsed):
-                            parsed = test_parsed
-                            break
-                    except Exception:
-                        continue
-        except Exception:
-            pass
-    
-    # If no JSON found in code fences, try the whole text or look for JSON object
-    if not parsed:
-        # Try to find JSON object in text (might have text before/after)
-        # Use a balanced bracket approach
+
+    if candidate.startswith("{") and candidate.endswith("}"):
         try:
-            if "{" in candidate:
-                # Find the first { and try to find matching }
-                start_idx = candidate.find("{")
-                if start_idx >= 0:
-                    brace_count = 0
-                    end_idx = start_idx
-                    for i in range(start_idx, len(candidate)):
-                        if candidate[i] == "{":
-                            brace_count += 1
-                        elif candidate[i] == "}":
-                            brace_count -= 1
-                            if brace_count == 0:
-                                end_idx = i
-                                break
-                    
-                    if brace_count == 0:  # Found balanced braces
-                        json_str = candidate[start_idx:end_idx + 1]
-                        try:
-                            test_parsed = json.loads(json_str)
-                            if isinstance(test_parsed, dict) and ("answer" in test_parsed or "bullets" in test_parsed):
-                                parsed = test_parsed
-                        except Exception:
-                            pass
+            parsed = _json_loads(candidate)
         except Exception:
-            pass
-        
-        # Last resort: try parsing the whole candidate if it starts/ends with braces
-        if not parsed and candidate.startswith("{") and candidate.endswith("}"):
-            try:
-                test_parsed = json.loads(candidate)
-                if isinstance(test_parsed, dict) and ("answer" in test_parsed or "bullets" in test_parsed):
-                    parsed = test_parsed
-            except Exception:
-                parsed = None
+            parsed = None
+        if not _is_structured(parsed):
+            parsed = None
+
+    # Plain-prose answers (no "{" at all) skip the scan and go straight to the fallback shape
+    if parsed is None and "{" in candidate:
+        parsed = _find_structured_object(candidate)
 
     # 2) If parsed is OK and has "answer", use it; else build our own
-    if isinstance(parsed, dict) and ("answer" in parsed or "bullets" in parsed):
-        answer = parsed.get("answer") or cleaned_text
-        # Clean citation markers from answer too
-        answer = _clean_citation_markers(answer)
+    if parsed is not None:
+        # Markers were stripped before parsing, so this is a strip() plus a cheap marker
+        # check (JSON escapes like \u3010 can still decode into one). cleaned_text is
+        # already clean and is reused as is.
+        answer = parsed.get("answer")
+        answer = _clean_citation_markers(answer) if answer else cleaned_text
         shaped = {
             "answer": answer,
             "sources": sources,
@@ -643,45 +776,264 @@ def _shape_structured_payload(text: str, sources: List[Dict[str, str]]) -> Dict[
         "raw_text": cleaned_text
     }
 
-def run_assistant_structured(thread_id: str, assistant_id: str) -> Dict[str, Any]:
+def _run_uses_file_search(run) -> bool:
+    """Whether the run had file_search enabled (the only tool that yields citations)."""
+    for tool in getattr(run, "tools", None) or []:
+        tool_type = tool.get("type") if isinstance(tool, dict) else getattr(tool, "type", None)
+        if tool_type == "file_search":
+            return True
+    return False
+
+def _fallback_citations_from_steps(thread_id: str, run_id: str) -> List[str]:
+    """
+    Recover cited file IDs from run steps when the message carried no annotations.
+    Pages once (newest steps first) and stops at the first step that yields file IDs.
+    """
+    try:
+        run_steps = get_client().beta.threads.runs.steps.list(
+            thread_id=thread_id,
+            run_id=run_id,
+            limit=20,
+            order="desc",
+        )
+    except Exception:
+        return []  # Silently fail if run steps can't be retrieved
+    return _file_ids_from_steps(run_steps.data)
+
+async def _afallback_citations_from_steps(thread_id: str, run_id: str) -> List[str]:
+    """Async variant of _fallback_citations_from_steps()."""
+    try:
+        run_steps = await get_async_client().beta.threads.runs.steps.list(
+            thread_id=thread_id,
+            run_id=run_id,
+            limit=20,
+            order="desc",
+        )
+    except Exception:
+        return []
+    return _file_ids_from_steps(run_steps.data)
+
+def _file_ids_from_steps(steps) -> List[str]:
+    """Unique file IDs from the newest run step whose tool calls/outputs reference files."""
+    file_ids: List[str] = []
+    try:
+        for step in steps:
+            details = _field(step, "step_details")
+            if not details:
+                continue
+            # file_search tool calls carry their results; older payloads used tool_outputs
+            details_type = _field(details, "type")
+            if details_type == "tool_calls":
+                outputs = [_field(call, "file_search") for call in _field(details, "tool_calls") or []]
+            elif details_type == "tool_outputs":
+                outputs = _field(details, "tool_outputs") or []
+            else:
+                continue
+
+            for output in outputs:
+                if not output:
+                    continue
+                # File search outputs might contain file_ids or results
+                output_file_ids = _field(output, "file_ids")
+                if output_file_ids is not None:
+                    file_ids.extend(output_file_ids)
+                else:
+                    for result in _field(output, "results") or []:
+                        result_file_id = _field(result, "file_id")
+                        if result_file_id:
+                            file_ids.append(result_file_id)
+            if file_ids:
+                break
+    except Exception:
+        pass  # Malformed step payloads just yield no fallback citations
+    return list(dict.fromkeys(file_ids))
+
+_RUN_POLL_INTERVAL_MS = 500
+
+# Shared worker pool for fanning out independent, I/O-bound OpenAI calls
+# (file metadata, image downloads) so they overlap instead of running back to back.
+_IO_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="openai-io")
+
+# ---------------- Response cache ----------------
+# Repeated questions to the same assistant reuse the last structured payload instead of
+# paying for a full run. Threads are multi-turn, so the key covers the question and the
+# thread's previous message: a follow-up only hits an answer given after the same reply,
+# never one from another conversation's context. Questions shorter than
+# _MIN_CACHED_QUERY_WORDS are not cached at all ("why?", "tell me more"), since they lean on
+# earlier turns the key doesn't see. This assumes the assistant answers a repeated question
+# the same way; turn it off (FOUNDER_ANSWER_CACHE=0) when assistants run at a high
+# temperature or answers must reflect new knowledge at once.
+
+_RESPONSE_CACHE = TTLCache(maxsize=1024, ttl=3600)
+_RESPONSE_CACHE_LOCK = threading.Lock()
+_MIN_CACHED_QUERY_WORDS = 4
+
+def _thread_cache_key(thread_id: str, assistant_id: str, user_text: Optional[str],
+                      pending: bool) -> Optional[str]:
+    """
+    Cache key for this turn, or None when it should not be cached. pending means the
+    user message is still to be added by the run (additional_messages), so the newest
+    message on the thread is already the previous turn. user_text None reads the
+    question from the thread.
+    """
+    if not _ANSWER_CACHE or (user_text is not None and _cacheable_query(user_text) is None):
+        return None
+    try:
+        msgs = get_client().beta.threads.messages.list(thread_id=thread_id, order="desc",
+                                                       limit=1 if pending else 2)
+    except Exception:
+        return None
+    return _cache_key_for_messages(msgs, assistant_id, user_text, pending)
+
+async def _athread_cache_key(thread_id: str, assistant_id: str, user_text: Optional[str],
+                             pending: bool) -> Optional[str]:
+    """Async variant of _thread_cache_key()."""
+    if not _ANSWER_CACHE or (user_text is not None and _cacheable_query(user_text) is None):
+        return None
+    try:
+        msgs = await get_async_client().beta.threads.messages.list(thread_id=thread_id, order="desc",
+                                                                   limit=1 if pending else 2)
+    except Exception:
+        return None
+    return _cache_key_for_messages(msgs, assistant_id, user_text, pending)
+
+def _cache_key_for_messages(msgs, assistant_id: str, user_text: Optional[str],
+                            pending: bool) -> Optional[str]:
+    data = list(msgs.data)
+    if not pending:
+        # The newest message is this turn's question
+        if not data or data[0].role != "user":
+            return None
+        newest = data.pop(0)
+        if user_text is None:
+            if getattr(newest, "attachments", None):
+                return None
+            user_text = _extract_text_and_citations(newest)["text"]
+    prior = f"{data[0].role}:{_extract_text_and_citations(data[0])['text']}" if data else ""
+    return _response_cache_key(assistant_id, user_text, prior)
+
+def _cacheable_user_text(messages: List[Dict[str, Any]]) -> str:
+    # The newest pending message keys the cache, unless it carries files for code_interpreter.
+    # Several pending messages are context the key doesn't cover, so those turns aren't cached.
+    last = messages[-1]
+    if (len(messages) > 1 or last.get("role") != "user" or last.get("attachments")
+            or not isinstance(last.get("content"), str)):
+        return ""
+    return last["content"]
+
+def _normalize_query(text: str) -> str:
+    # Questions that differ only in case, spacing or closing punctuation
+    # ("What is a good burn rate?" vs "what is a good  burn rate") share an entry.
+    return " ".join(text.casefold().split()).rstrip("?!. ")
+
+def _cacheable_query(user_text: str) -> Optional[str]:
+    query = _normalize_query(user_text)
+    if len(query.split()) < _MIN_CACHED_QUERY_WORDS:
+        return None
+    return query
+
+def _response_cache_key(assistant_id: str, user_text: str, prior_text: str) -> Optional[str]:
+    query = _cacheable_query(user_text)
+    if query is None:
+        return None
+    # The prior turn is hashed on its own so its text can't run into the query's
+    prior = hashlib.blake2b(prior_text.encode("utf-8"), digest_size=16).hexdigest()
+    return hashlib.blake2b(f"{assistant_id}|{prior}|{query}".encode("utf-8"), digest_size=16).hexdigest()
+
+def _get_cached_response(cache_key: str) -> Optional[Dict[str, Any]]:
+    # Each hit gets its own copy, so a caller editing its payload can't change the cache
+    with _RESPONSE_CACHE_LOCK:
+        cached = _RESPONSE_CACHE.get(cache_key)
+    return copy.deepcopy(cached) if cached is not None else None
+
+def _store_cached_response(cache_key: str, payload: Dict[str, Any]):
+    # Chart images are tied to the data of a specific run and are large; don't keep them.
+    if payload.get("images"):
+        return
+    payload = copy.deepcopy(payload)  # the caller gets the original
+    with _RESPONSE_CACHE_LOCK:
+        _RESPONSE_CACHE[cache_key] = payload
+
+_EMPTY_USAGE = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+
+def _run_message_params(additional_messages: Optional[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    # Only send the field when there is something to add
+    return {"additional_messages": additional_messages} if additional_messages else {}
+
+def _cached_reply(cached: Dict[str, Any]) -> str:
+    # Text recorded on the thread for a cache hit, so follow-up questions have context.
+    return cached.get("raw_text") or cached.get("answer") or ""
+
+def _run_usage(run) -> Optional[Dict[str, int]]:
+    # Extract usage information from the run
+    usage = getattr(run, 'usage', None)
+    if usage:
+        return {
+            "input_tokens": getattr(usage, 'prompt_tokens', 0),
+            "output_tokens": getattr(usage, 'completion_tokens', 0),
+            "total_tokens": getattr(usage, 'total_tokens', 0)
+        }
+    return None
+
+def _assistant_message(msgs):
+    # After a successful run, the newest message should be the assistant's response
+    if not msgs.data or msgs.data[0].role != "assistant":
+        return None
+    return msgs.data[0]
+
+def _finish_payload(text: str, sources: List[Dict[str, str]], image_data: List[Dict[str, str]],
+                    usage: Optional[Dict[str, int]], cache_key: Optional[str]) -> Dict[str, Any]:
+    payload = _shape_structured_payload(text, sources)
+    payload["usage"] = usage or dict(_EMPTY_USAGE)
+    if image_data:
+        payload["images"] = image_data
+    if cache_key and payload.get("answer"):
+        _store_cached_response(cache_key, payload)
+    return payload
+
+def run_assistant_structured(thread_id: str, assistant_id: str, user_text: Optional[str] = None,
+                             additional_messages: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
     """
     Run the assistant and return a normalized, structured payload:
     { answer, sources: [{file_id, filename, quote}], raw_text, usage: {input_tokens, output_tokens, total_tokens} }
+
+    additional_messages (see user_message()) are added to the thread by the run request
+    itself, in order, instead of one add_message() call each.
+    user_text is the user message just added to the thread, when the caller has it;
+    together with the thread's previous message it keys the response cache.
+    Pass "" for turns that should not be cached (e.g. with file attachments).
+    With additional_messages it is taken from the last message.
     """
     client = get_client()
-    run = client.beta.threads.runs.create(
+    if additional_messages and user_text is None:
+        user_text = _cacheable_user_text(additional_messages)
+
+    cache_key = _thread_cache_key(thread_id, assistant_id, user_text, bool(additional_messages))
+    cached = _get_cached_response(cache_key) if cache_key else None
+    if cached is not None:
+        # Keep the thread history coherent for follow-up questions.
+        for message in additional_messages or ():
+            client.beta.threads.messages.create(thread_id=thread_id, **message)
+        client.beta.threads.messages.create(thread_id=thread_id, role="assistant", content=_cached_reply(cached))
+        cached.update(usage=dict(_EMPTY_USAGE), cached=True)
+        return cached
+
+    # The SDK polls with a sleep between checks (and honours the server's poll-after hint)
+    # until the run reaches a terminal state, instead of spinning on runs.retrieve.
+    run = client.beta.threads.runs.create_and_poll(
         thread_id=thread_id,
         assistant_id=assistant_id,
+        poll_interval_ms=_RUN_POLL_INTERVAL_MS,
+        **_run_message_params(additional_messages),
     )
-    # poll to completion
-    while True:
-        r = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
-        if r.status in ("completed", "failed", "cancelled", "expired"):
-            run = r
-            break
     if run.status != "completed":
         raise RuntimeError(f"Run failed: {run.status}")
-    
-    # Extract usage information from the run
-    usage = None
-    if hasattr(run, 'usage') and run.usage:
-        usage = {
-            "input_tokens": getattr(run.usage, 'prompt_tokens', 0),
-            "output_tokens": getattr(run.usage, 'completion_tokens', 0),
-            "total_tokens": getattr(run.usage, 'total_tokens', 0)
-        }
+    usage = _run_usage(run)
 
-    # After successful run, the newest message should be the assistant's response
     msgs = client.beta.threads.messages.list(thread_id=thread_id, order="desc", limit=1)
-    if not msgs.data or msgs.data[0].role != "assistant":
-        return {
-            "answer": "",
-            "sources": [],
-            "raw_text": "",
-            "usage": usage or {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
-        }
-
-    assistant_msg = msgs.data[0]
+    assistant_msg = _assistant_message(msgs)
+    if assistant_msg is None:
+        return _finish_payload("", [], [], usage, None)
 
     # Extract text, citations, and images from message
     extracted = _extract_text_and_citations(assistant_msg)
@@ -689,140 +1041,170 @@ def run_assistant_structured(thread_id: str, assistant_id: str) -> Dict[str, Any
     citations = _dedupe_sources(extracted["citations"])
     images = extracted.get("images", [])
 
-    # Fallback: Try to extract file IDs from run steps if no citations found
-    file_ids_from_steps = set()
-    if not citations:
-        try:
-            run_steps = client.beta.threads.runs.steps.list(
-                thread_id=thread_id,
-                run_id=run.id
-            )
-            for step in run_steps.data:
-                if hasattr(step, "step_details") and step.step_details:
-                    step_details = step.step_details
-                    step_type = getattr(step_details, "type", "")
-                    
-                    # Check for tool_outputs to get file IDs from file_search results
-                    if step_type == "tool_outputs":
-                        tool_outputs = getattr(step_details, "tool_outputs", []) or []
-                        for output in tool_outputs:
-                            # Try to extract file IDs from output
-                            output_dict = None
-                            if hasattr(output, "model_dump"):
-                                output_dict = output.model_dump()
-                            elif hasattr(output, "dict"):
-                                output_dict = output.dict()
-                            elif isinstance(output, dict):
-                                output_dict = output
-                            
-                            if output_dict:
-                                # File search outputs might contain file_ids or results
-                                if "file_ids" in output_dict:
-                                    file_ids_from_steps.update(output_dict["file_ids"])
-                                elif "results" in output_dict:
-                                    results = output_dict["results"]
-                                    if isinstance(results, list):
-                                        for result in results:
-                                            if isinstance(result, dict) and "file_id" in result:
-                                                file_ids_from_steps.add(result["file_id"])
-                                            elif hasattr(result, "file_id"):
-                                                file_ids_from_steps.add(result.file_id)
-        except Exception:
-            pass  # Silently fail if run steps can't be retrieved
-    
-    # If we found file IDs from run steps but no citations, add them
-    if file_ids_from_steps and not citations:
-        for file_id in file_ids_from_steps:
-            citations.append({
-                "file_id": file_id,
-                "quote": ""  # No quote available from run steps
-            })
-
-    # Fallback: Try converting message to dict if it's a Pydantic model
-    if not citations:
-        try:
-            msg_dict = None
-            if hasattr(assistant_msg, "model_dump"):
-                msg_dict = assistant_msg.model_dump()
-            elif hasattr(assistant_msg, "dict"):
-                msg_dict = assistant_msg.dict()
-            
-            # If we have a dict representation and no citations, try extracting from dict
-            if msg_dict:
-                content_list = msg_dict.get("content", [])
-                for part_dict in content_list:
-                    if isinstance(part_dict, dict) and part_dict.get("type") == "text":
-                        text_dict = part_dict.get("text", {})
-                        anns_list = text_dict.get("annotations", [])
-                        for ann_dict in anns_list:
-                            if isinstance(ann_dict, dict) and ann_dict.get("type") == "file_citation":
-                                fc_dict = ann_dict.get("file_citation", {})
-                                file_id = fc_dict.get("file_id")
-                                if file_id:
-                                    quote = fc_dict.get("quote", "") or ""
-                                    citations.append({
-                                        "file_id": file_id,
-                                        "quote": quote
-                                    })
-        except Exception:
-            pass  # Silently fail if dict extraction fails
-    
-    # Re-dedupe after potential fallback extraction
-    citations = _dedupe_sources(citations)
+    # Fallback (FOUNDER_RUN_STEPS_FALLBACK=1): Try to extract file IDs from run steps if no
+    # citations found. Only worth a round trip when the run could have searched files at all.
+    # The helper returns unique file IDs, so the list needs no second dedupe pass.
+    if _STEPS_FALLBACK and not citations and text and _run_uses_file_search(run):
+        citations = [
+            {"file_id": file_id, "quote": ""}  # No quote available from run steps
+            for file_id in _fallback_citations_from_steps(thread_id, run.id)
+        ]
 
-    # Enrich with filenames
-    sources = []
-    for c in citations:
-        sources.append({
-            "file_id": c["file_id"],
-            "filename": _filename_for_file_id(c["file_id"]),
-            "quote": c.get("quote", "")
-        })
+    # Enrich with filenames, and download images as base64 for display
+    sources, image_data = _enrich_sources_and_images(citations, images)
+    return _finish_payload(text, sources, image_data, usage, cache_key)
 
-    # Download images and convert to base64 for display
-    image_data = []
-    for img in images:
-        file_id = img.get("file_id")
-        if file_id:
-            try:
-                # Download the image file from OpenAI
-                file_response = client.files.content(file_id)
-                image_bytes = file_response.read()
-                
-                # Convert to base64 data URL
-                # Try to determine content type from file metadata
-                try:
-                    file_info = client.files.retrieve(file_id)
-                    filename = getattr(file_info, "filename", "image.png")
-                    content_type, _ = mimetypes.guess_type(filename)
-                    if not content_type:
-                        content_type = "image/png"  # Default to PNG
-                except Exception:
-                    content_type = "image/png"
-                
-                base64_data = base64.b64encode(image_bytes).decode("utf-8")
-                data_url = f"data:{content_type};base64,{base64_data}"
-                
-                image_data.append({
-                    "file_id": file_id,
-                    "data_url": data_url
-                })
-            except Exception:
-                # If image download fails, skip it
-                pass
-    
-    # Shape final payload
-    payload = _shape_structured_payload(text, sources)
-    payload["usage"] = usage or {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
-    if image_data:
-        payload["images"] = image_data
-    return payload
+async def run_assistant_structured_async(thread_id: str, assistant_id: str, user_text: Optional[str] = None,
+                                         additional_messages: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Async version of run_assistant_structured() for the FastAPI handlers.
+    Same payload; the independent post-run fetches (file metadata for every cited
+    file, image downloads) run concurrently on the event loop, so they cost about
+    one round trip instead of one each.
+    """
+    client = get_async_client()
+    if additional_messages and user_text is None:
+        user_text = _cacheable_user_text(additional_messages)
+
+    cache_key = await _athread_cache_key(thread_id, assistant_id, user_text, bool(additional_messages))
+    cached = _get_cached_response(cache_key) if cache_key else None
+    if cached is not None:
+        for message in additional_messages or ():
+            await client.beta.threads.messages.create(thread_id=thread_id, **message)
+        await client.beta.threads.messages.create(thread_id=thread_id, role="assistant", content=_cached_reply(cached))
+        cached.update(usage=dict(_EMPTY_USAGE), cached=True)
+        return cached
 
-def run_assistant_stream(thread_id: str, assistant_id: str) -> Generator[Dict[str, Any], None, None]:
+    run = await client.beta.threads.runs.create_and_poll(
+        thread_id=thread_id,
+        assistant_id=assistant_id,
+        poll_interval_ms=_RUN_POLL_INTERVAL_MS,
+        **_run_message_params(additional_messages),
+    )
+    if run.status != "completed":
+        raise RuntimeError(f"Run failed: {run.status}")
+    usage = _run_usage(run)
+
+    msgs = await client.beta.threads.messages.list(thread_id=thread_id, order="desc", limit=1)
+    assistant_msg = _assistant_message(msgs)
+    if assistant_msg is None:
+        return _finish_payload("", [], [], usage, None)
+
+    extracted = _extract_text_and_citations(assistant_msg)
+    text = extracted["text"]
+    citations = _dedupe_sources(extracted["citations"])
+    image_ids = [img["file_id"] for img in extracted.get("images", []) if img.get("file_id")]
+
+    # Run steps are only fetched when the message carried no citations (see run_assistant_structured).
+    if _STEPS_FALLBACK and not citations and text and _run_uses_file_search(run):
+        citations = [
+            {"file_id": file_id, "quote": ""}
+            for file_id in await _afallback_citations_from_steps(thread_id, run.id)
+        ]
+
+    # Cached filenames are answered inline; only the misses are awaited
+    id_to_name, misses = _cached_filenames(c["file_id"] for c in citations)
+    results = await asyncio.gather(
+        *(_afile_metadata(fid) for fid in misses),
+        *(_aimage_data_url(fid) for fid in image_ids),
+    )
+    id_to_name.update((fid, name or fid) for fid, name in zip(misses, results))
+    sources = _sources_with_filenames(citations, id_to_name)
+    image_data = [r for r in results[len(misses):] if r]
+    return _finish_payload(text, sources, image_data, usage, cache_key)
+
+# A sources event goes out once this many new citations are pending, or when the last
+# one is older than the interval (seconds).
+_SOURCES_EMIT_MIN_NEW = 3
+_SOURCES_EMIT_INTERVAL = 0.15
+
+def _sources_event(citations: List[Dict[str, str]]) -> Dict[str, Any]:
+    """
+    Interim sources update. Only filenames already cached are filled in (others are
+    None), so streaming never waits on lookups; the done event resolves them all in
+    one batch. The stream dedupes citations as they arrive.
+    """
+    names, _ = _cached_filenames(c["file_id"] for c in citations)
+    return {
+        "type": "sources",
+        "sources": [
+            {"file_id": c["file_id"], "filename": names.get(c["file_id"]), "quote": c["quote"]}
+            for c in citations
+        ]
+    }
+
+# Streamed text goes out once this many characters are pending, or when the last
+# text_delta event is older than the interval (seconds).
+_TEXT_EMIT_MIN_CHARS = 32
+_TEXT_EMIT_INTERVAL = 0.05
+# Structured replies open their JSON object (or its code fence) right away. If this
+# many characters arrive with no "{" among them, the reply is prose and the answer
+# extractor is dropped for the rest of the stream.
+_JSON_SNIFF_CHARS = 64
+
+class _TextDeltaBatcher:
+    """
+    Coalesces streamed text into fewer text_delta events. SDK deltas can be a token or
+    less, and each event re-sends the accumulated answer, so small consecutive deltas are
+    held briefly and sent together. Markers are cleaned per delta; the answer is only
+    extracted when an event actually goes out.
+    """
+
+    def __init__(self):
+        self._cleaner = _CitationCleaner()
+        self._extractor = _StreamingAnswerExtractor()
+        self._pending: List[str] = []
+        self._pending_chars = 0
+        self._last_emit = 0.0
+
+    def add(self, text_delta: str) -> Optional[Dict[str, Any]]:
+        """Buffer one delta; returns a text_delta event when one is due."""
+        cleaned = self._cleaner.feed(text_delta)
+        self._pending.append(cleaned)
+        self._pending_chars += len(cleaned)
+        if (self._pending_chars >= _TEXT_EMIT_MIN_CHARS
+                or time.monotonic() - self._last_emit > _TEXT_EMIT_INTERVAL):
+            return self.flush()
+        return None
+
+    def flush(self, final: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        The text_delta event for everything buffered, or None if nothing is. final=True
+        (the message is complete) also releases what the cleaner is holding back.
+        """
+        if final:
+            tail = self._cleaner.flush()
+            if tail:
+                self._pending.append(tail)
+        if not self._pending:
+            return None
+        cleaned_accumulated = self._cleaner.text.strip()
+        display_text = cleaned_accumulated
+        if self._extractor is not None:
+            # Show the extracted answer once the model's JSON has one
+            answer = self._extractor.update(cleaned_accumulated)
+            if answer:
+                display_text = answer
+            elif (len(cleaned_accumulated) >= _JSON_SNIFF_CHARS
+                    and "{" not in cleaned_accumulated[:_JSON_SNIFF_CHARS]):
+                self._extractor = None
+        content = "".join(self._pending).strip()
+        self._pending.clear()
+        self._pending_chars = 0
+        self._last_emit = time.monotonic()
+        return {
+            "type": "text_delta",
+            "content": content,
+            "accumulated": display_text
+        }
+
+def run_assistant_stream(thread_id: str, assistant_id: str,
+                         additional_messages: Optional[List[Dict[str, Any]]] = None) -> Generator[Dict[str, Any], None, None]:
     """
     Stream assistant responses as they are generated.
     Yields chunks with structure: {type, content, delta, ...}
     Types: 'text_delta', 'sources', 'images', 'done', 'error'
+    additional_messages are added to the thread by the run request (see user_message()).
     """
     client = get_client()
     
@@ -831,78 +1213,77 @@ def run_assistant_stream(thread_id: str, assistant_id: str) -> Generator[Dict[st
         with client.beta.threads.runs.stream(
             thread_id=thread_id,
             assistant_id=assistant_id,
+            **_run_message_params(additional_messages),
         ) as stream:
             accumulated_text = ""
-            citations = []
+            text_batcher = _TextDeltaBatcher()
+            citations = []  # unique (file_id, quote) pairs, in arrival order
+            seen_citations = set()
+            emitted_sources = 0  # len(citations) at the last sources event
+            last_sources_emit = 0.0
             images = []
             usage = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
             
             for event in stream:
-                # Handle text deltas
+                # Text, images and citation annotations all arrive in delta events; walk
+                # each delta's content once
                 if event.event == "thread.message.delta":
-                    if hasattr(event, "data") and hasattr(event.data, "delta"):
-                        delta = event.data.delta
-                        if hasattr(delta, "content") and delta.content is not None:
-                            for content_item in delta.content:
-                                if hasattr(content_item, "type"):
-                                    if content_item.type == "text":
-                                        if hasattr(content_item, "text") and hasattr(content_item.text, "value"):
-                                            text_delta = content_item.text.value
-                                            accumulated_text += text_delta
-                                            # Clean citation markers from delta
-                                            cleaned_delta = _clean_citation_markers(text_delta)
-                                            cleaned_accumulated = _clean_citation_markers(accumulated_text)
-                                            
-                                            # Try to extract answer from JSON if present (handles incomplete JSON during streaming)
-                                            display_text = cleaned_accumulated
-                                            extracted_answer = _extract_answer_from_incomplete_json(cleaned_accumulated)
-                                            if extracted_answer:
-                                                display_text = extracted_answer
-                                            
-                                            yield {
-                                                "type": "text_delta",
-                                                "content": cleaned_delta,
-                                                "accumulated": display_text  # Use extracted answer if JSON was parsed
-                                            }
-                                    elif content_item.type == "image_file":
-                                        if hasattr(content_item, "image_file") and hasattr(content_item.image_file, "file_id"):
-                                            file_id = content_item.image_file.file_id
-                                            images.append({"file_id": file_id})
+                    delta = getattr(getattr(event, "data", None), "delta", None)
+                    for content_item in getattr(delta, "content", None) or []:
+                        item_type = getattr(content_item, "type", None)
+                        if item_type == "text":
+                            text = getattr(content_item, "text", None)
+                            text_delta = getattr(text, "value", None)
+                            if text_delta is not None:
+                                accumulated_text += text_delta
+                                text_event = text_batcher.add(text_delta)
+                                if text_event:
+                                    yield text_event
+                            
+                            # Citations (annotations) come in the same delta
+                            for ann in getattr(text, "annotations", None) or []:
+                                if getattr(ann, "type", None) == "file_citation":
+                                    file_citation = getattr(ann, "file_citation", None)
+                                    file_id = getattr(file_citation, "file_id", None)
+                                    if file_id is not None:
+                                        quote = getattr(file_citation, "quote", "") or ""
+                                        if (file_id, quote) not in seen_citations:
+                                            seen_citations.add((file_id, quote))
+                                            citations.append({
+                                                "file_id": file_id,
+                                                "quote": quote
+                                            })
+                        elif item_type == "image_file":
+                            file_id = getattr(getattr(content_item, "image_file", None), "file_id", None)
+                            if file_id is not None:
+                                images.append({"file_id": file_id})
+                    
+                    # Coalesce source updates: citations tend to arrive in bursts, and each
+                    # update re-sends the whole list
+                    if len(citations) > emitted_sources and (
+                        len(citations) - emitted_sources >= _SOURCES_EMIT_MIN_NEW
+                        or time.monotonic() - last_sources_emit > _SOURCES_EMIT_INTERVAL
+                    ):
+                        # Send buffered text first so events stay in stream order
+                        text_event = text_batcher.flush()
+                        if text_event:
+                            yield text_event
+                        yield _sources_event(citations)
+                        emitted_sources, last_sources_emit = len(citations), time.monotonic()
+                    continue
                 
-                # Handle annotations (citations) - these come in the same delta event
-                if event.event == "thread.message.delta" and hasattr(event, "data"):
-                    if hasattr(event.data, "delta") and hasattr(event.data.delta, "content"):
-                        delta_content = event.data.delta.content
-                        if delta_content is not None:
-                            for content_item in delta_content:
-                                if hasattr(content_item, "type") and content_item.type == "text":
-                                    if hasattr(content_item, "text") and hasattr(content_item.text, "annotations"):
-                                        annotations = content_item.text.annotations
-                                        if annotations is not None:
-                                            for ann in annotations:
-                                                if hasattr(ann, "type") and ann.type == "file_citation":
-                                                    if hasattr(ann, "file_citation") and hasattr(ann.file_citation, "file_id"):
-                                                        file_id = ann.file_citation.file_id
-                                                        quote = getattr(ann.file_citation, "quote", "") or ""
-                                                        citations.append({
-                                                            "file_id": file_id,
-                                                            "quote": quote
-                                                        })
-                                                        # Yield source update
-                                                        sources = []
-                                                        for c in _dedupe_sources(citations):
-                                                            sources.append({
-                                                                "file_id": c["file_id"],
-                                                                "filename": _filename_for_file_id(c["file_id"]),
-                                                                "quote": c.get("quote", "")
-                                                            })
-                                                        yield {
-                                                            "type": "sources",
-                                                            "sources": sources
-                                                        }
+                # Any other event ends a run of deltas: send the text buffered so far
+                text_event = text_batcher.flush(final=event.event == "thread.message.completed")
+                if text_event:
+                    yield text_event
+                
+                # Flush citations held back by the coalescing above
+                if event.event == "thread.message.completed" and len(citations) > emitted_sources:
+                    yield _sources_event(citations)
+                    emitted_sources = len(citations)
                 
                 # Handle completion
-                if event.event == "thread.run.completed":
+                elif event.event == "thread.run.completed":
                     # Get final message and extract any remaining data
                     try:
                         msgs = client.beta.threads.messages.list(thread_id=thread_id, order="desc", limit=1)
@@ -922,67 +1303,23 @@ def run_assistant_stream(thread_id: str, assistant_id: str) -> Generator[Dict[st
                                 images = final_images
                             
                             # Get usage from run
-                            if hasattr(event, "data") and hasattr(event.data, "usage"):
-                                usage = {
-                                    "input_tokens": getattr(event.data.usage, "prompt_tokens", 0),
-                                    "output_tokens": getattr(event.data.usage, "completion_tokens", 0),
-                                    "total_tokens": getattr(event.data.usage, "total_tokens", 0)
-                                }
+                            usage = _run_usage(getattr(event, "data", None)) or usage
                             
-                            # Download images and convert to base64
-                            image_data = []
-                            for img in images:
-                                file_id = img.get("file_id")
-                                if file_id:
-                                    try:
-                                        file_response = client.files.content(file_id)
-                                        image_bytes = file_response.read()
-                                        
-                                        try:
-                                            file_info = client.files.retrieve(file_id)
-                                            filename = getattr(file_info, "filename", "image.png")
-                                            content_type, _ = mimetypes.guess_type(filename)
-                                            if not content_type:
-                                                content_type = "image/png"
-                                        except Exception:
-                                            content_type = "image/png"
-                                        
-                                        base64_data = base64.b64encode(image_bytes).decode("utf-8")
-                                        data_url = f"data:{content_type};base64,{base64_data}"
-                                        
-                                        image_data.append({
-                                            "file_id": file_id,
-                                            "data_url": data_url
-                                        })
-                                    except Exception:
-                                        pass
+                            # Enrich with filenames, and download images as base64
+                            final_sources, image_data = _enrich_sources_and_images(citations, images)
                             
                             # Use accumulated text if final_text is empty
                             if not final_text and accumulated_text:
                                 final_text = accumulated_text
                             
                             # Shape final payload
-                            shaped = _shape_structured_payload(final_text, [
-                                {
-                                    "file_id": c["file_id"],
-                                    "filename": _filename_for_file_id(c["file_id"]),
-                                    "quote": c.get("quote", "")
-                                }
-                                for c in citations
-                            ])
+                            shaped = _shape_structured_payload(final_text, final_sources)
                             
                             yield {
                                 "type": "done",
                                 "answer": shaped.get("answer", ""),
                                 "bullets": shaped.get("bullets"),
-                                "sources": [
-                                    {
-                                        "file_id": c["file_id"],
-                                        "filename": _filename_for_file_id(c["file_id"]),
-                                        "quote": c.get("quote", "")
-                                    }
-                                    for c in citations
-                                ],
+                                "sources": final_sources,
                                 "images": image_data,
                                 "usage": usage
                             }
@@ -993,11 +1330,17 @@ def run_assistant_stream(thread_id: str, assistant_id: str) -> Generator[Dict[st
                         }
                 
                 # Handle errors
-                if event.event == "error":
+                elif event.event == "error":
+                    data = getattr(event, "data", None)
                     yield {
                         "type": "error",
-                        "error": str(event.data) if hasattr(event, "data") else "Unknown error"
+                        "error": str(data) if data is not None else "Unknown error"
                     }
+            
+            # A stream that ends mid-message still delivers its last text
+            text_event = text_batcher.flush(final=True)
+            if text_event:
+                yield text_event
     except Exception as e:
         yield {
             "type": "error",
@@ -5,8 +5,8 @@ Routes queries to TechAdvisor, MarketingAdvisor, or InvestorAdvisor.
 import re
 import json
 from typing import Dict, Any, List, Tuple
-from openai import OpenAI
-import os
+
+from app.openai_client import get_client, get_model
 
 # High-risk keywords that require consult-then-decide even with good confidence
 HIGH_RISK_KEYWORDS = [
@@ -83,7 +83,8 @@ def classifier_classify(query: str) -> Tuple[str, float, str, float]:
     Use OpenAI to classify the query.
     Returns (label, confidence, top2_label, margin).
     """
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    # Shared client: reuses its pooled (HTTP/2) connections instead of a new TLS handshake per query
+    client = get_client()
     
     prompt = f"""Classify this startup founder question into one of three categories:
 - tech: Technical architecture, AI/ML models, system design, infrastructure, scalability
@@ -102,7 +103,7 @@ Respond with ONLY a JSON object:
 
     try:
         response = client.chat.completions.create(
-            model=os.getenv("OPENAI_MODEL", "gpt-4.1"),
+            model=get_model(),
             messages=[
                 {"role": "system", "content": "You are a classification assistant. Return only valid JSON."},
                 {"role": "user", "content": prompt}
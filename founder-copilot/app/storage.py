@@ -1,23 +1,65 @@
-import json, os
+import copy, json, os
 from typing import Dict
 
+# orjson is optional (it is listed in requirements.txt); fall back to the stdlib.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 STATE_DIR = os.getenv("STATE_DIR", "state")
 STATE_PATH = os.path.join(STATE_DIR, "copilot_state.json")
 
 def _ensure_dir():
     os.makedirs(STATE_DIR, exist_ok=True)
 
+# The app reads IDs on every request but only the seed scripts write them, so keep the
+# parsed state and re-read the file only when it changes. Writes replace the file, so the
+# inode is part of the stamp: a same-size rewrite within one mtime tick is still noticed.
+_state_cache = None
+_state_stamp = None
+
+def _stamp(st: os.stat_result) -> tuple:
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+def _cached_state():
+    """The shared parsed state. Never modify it; use load_state() for a copy."""
+    global _state_cache, _state_stamp
+    try:
+        st = os.stat(STATE_PATH)
+    except FileNotFoundError:
+        return {}
+    if _stamp(st) != _state_stamp:
+        with open(STATE_PATH, "rb") as f:
+            data = f.read()
+        _state_cache = orjson.loads(data) if orjson is not None else json.loads(data)
+        _state_stamp = _stamp(st)
+    return _state_cache
+
 def load_state():
-    _ensure_dir()
-    if os.path.exists(STATE_PATH):
-        with open(STATE_PATH, "r") as f:
-            return json.load(f)
-    return {}
+    """A private copy of the state, so callers can modify it without touching the cache."""
+    return copy.deepcopy(_cached_state())
+
+def _dumps(d, pretty: bool) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(d, option=orjson.OPT_INDENT_2 if pretty else 0)
+    if pretty:
+        return json.dumps(d, indent=2).encode()
+    return json.dumps(d, separators=(",", ":")).encode()
 
-def save_state(d):
+def save_state(d, pretty: bool = False):
+    """
+    Write the state atomically: dump to a temp file next to it, then rename over it, so
+    a crash mid-write never leaves a torn file for readers. pretty=True indents the JSON.
+    """
+    global _state_cache, _state_stamp
     _ensure_dir()
-    with open(STATE_PATH, "w") as f:
-        json.dump(d, f, indent=2)
+    tmp_path = f"{STATE_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_dumps(d, pretty))
+    os.replace(tmp_path, STATE_PATH)
+    # Only cache what reached disk, and keep it apart from the caller's dict
+    _state_cache, _state_stamp = copy.deepcopy(d), _stamp(os.stat(STATE_PATH))
 
 def set_ids(assistant_id: str, vector_store_id: str):
     """Legacy function for single assistant. Use set_assistant_ids instead."""
@@ -28,7 +70,7 @@ def set_ids(assistant_id: str, vector_store_id: str):
 
 def get_ids():
     """Legacy function for single assistant. Use get_assistant_ids instead."""
-    state = load_state()
+    state = _cached_state()
     return state.get("assistant_id"), state.get("vector_store_id")
 
 def set_assistant_ids(assistants: Dict[str, Dict[str, str]]):
@@ -49,12 +91,11 @@ def get_assistant_ids(label: str) -> tuple:
     Get assistant_id and vector_store_id for a specific label.
     Returns (assistant_id, vector_store_id) or (None, None) if not found.
     """
-    state = load_state()
+    state = _cached_state()
     assistants = state.get("assistants", {})
     assistant_data = assistants.get(label, {})
     return assistant_data.get("assistant_id"), assistant_data.get("vector_store_id")
 
 def get_all_assistant_ids() -> Dict[str, Dict[str, str]]:
     """Get all assistant IDs."""
-    state = load_state()
-    return state.get("assistants", {})
+    return copy.deepcopy(_cached_state().get("assistants", {}))
@@ -1,4 +1,4 @@
-import os, glob
+import os
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -6,13 +6,19 @@ from app.openai_client import create_vector_store, upload_files_batch_to_vs, cre
 from app.storage import set_ids
 
 VS_NAME = "founder_copilot_knowledge"
+DATA_EXTENSIONS = frozenset({".md", ".txt", ".json"})
 COPILOT_NAME = os.getenv("COPILOT_NAME", "FounderCopilot")
 
 def main():
     vs = create_vector_store(VS_NAME)
     print("Vector Store:", vs.id)
 
-    file_paths = [p for p in glob.glob("data/*") if any(p.endswith(ext) for ext in (".md", ".txt", ".json"))]
+    file_paths = [
+        f"data/{entry.name}" for entry in sorted(os.scandir("data"), key=lambda e: e.name)
+        if not entry.name.startswith(".")
+        and os.path.splitext(entry.name)[1].lower() in DATA_EXTENSIONS
+        and entry.is_file()
+    ] if os.path.isdir("data") else []
     if not file_paths:
         raise SystemExit("No files found under ./data. Add .md/.txt/.json files and rerun.")
 
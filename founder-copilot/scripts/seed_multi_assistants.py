@@ -5,7 +5,7 @@ Seed script to create three specialized assistants with separate vector stores:
 - InvestorAdvisor (KPI, deck, fundraising)
 """
 import os
-import glob
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import sys
 
@@ -18,6 +18,9 @@ load_dotenv()
 from app.openai_client import create_vector_store, upload_files_batch_to_vs, create_specialized_assistant
 from app.storage import set_assistant_ids
 
+# File types uploaded from each data directory
+DATA_EXTENSIONS = frozenset({".md", ".txt", ".json", ".csv"})
+
 # Assistant configurations
 ASSISTANTS = {
     "tech": {
@@ -40,50 +43,63 @@ ASSISTANTS = {
     }
 }
 
+def setup_assistant(label, config):
+    """
+    Create one assistant's vector store, upload its files, and create the assistant.
+    Runs in a worker thread, so output is prefixed with the assistant name.
+    """
+    def log(msg):
+        print(f"[{config['name']}] {msg}")
+    
+    # Create vector store
+    vs = create_vector_store(config["vector_store_name"])
+    log(f"Vector Store: {vs.id}")
+    
+    # Find files in the assistant's data directory
+    data_dir = config["data_dir"]
+    if not os.path.exists(data_dir):
+        log(f"Warning: {data_dir} does not exist. Creating directory...")
+        os.makedirs(data_dir, exist_ok=True)
+        log(f"Created {data_dir}. Please add .md/.txt/.json files to this directory.")
+    
+    file_paths = [
+        f"{data_dir}/{entry.name}" for entry in sorted(os.scandir(data_dir), key=lambda e: e.name)
+        if not entry.name.startswith(".")  # glob("*") skipped hidden files too
+        and os.path.splitext(entry.name)[1].lower() in DATA_EXTENSIONS
+        and entry.is_file()
+    ]
+    
+    if file_paths:
+        log(f"Uploading {len(file_paths)} files to vector store...")
+        batch = upload_files_batch_to_vs(vs.id, file_paths)
+        log(f"File batch status: {batch.status}")
+    else:
+        log(f"Warning: No files found in {data_dir}. Assistant will be created with empty vector store.")
+        log("You can add files later and re-run this script to update the vector store.")
+    
+    # Create specialized assistant
+    asst = create_specialized_assistant(
+        label=label,
+        vector_store_id=vs.id,
+        enable_code_interpreter=config["enable_code_interpreter"]
+    )
+    log(f"Assistant: {asst.id}")
+    
+    return {
+        "assistant_id": asst.id,
+        "vector_store_id": vs.id
+    }
+
 def main():
-    assistants_data = {}
+    print(f"\n{'='*60}")
+    print(f"Setting up {', '.join(c['name'] for c in ASSISTANTS.values())}...")
+    print(f"{'='*60}")
     
-    for label, config in ASSISTANTS.items():
-        print(f"\n{'='*60}")
-        print(f"Setting up {config['name']}...")
-        print(f"{'='*60}")
-        
-        # Create vector store
-        vs = create_vector_store(config["vector_store_name"])
-        print(f"Vector Store: {vs.id}")
-        
-        # Find files in the assistant's data directory
-        data_dir = config["data_dir"]
-        if not os.path.exists(data_dir):
-            print(f"Warning: {data_dir} does not exist. Creating directory...")
-            os.makedirs(data_dir, exist_ok=True)
-            print(f"Created {data_dir}. Please add .md/.txt/.json files to this directory.")
-        
-        file_paths = [
-            p for p in glob.glob(f"{data_dir}/*")
-            if any(p.endswith(ext) for ext in (".md", ".txt", ".json", ".csv"))
-        ]
-        
-        if file_paths:
-            print(f"Uploading {len(file_paths)} files to vector store...")
-            batch = upload_files_batch_to_vs(vs.id, file_paths)
-            print(f"File batch status: {batch.status}")
-        else:
-            print(f"Warning: No files found in {data_dir}. Assistant will be created with empty vector store.")
-            print("You can add files later and re-run this script to update the vector store.")
-        
-        # Create specialized assistant
-        asst = create_specialized_assistant(
-            label=label,
-            vector_store_id=vs.id,
-            enable_code_interpreter=config["enable_code_interpreter"]
-        )
-        print(f"Assistant: {asst.id}")
-        
-        assistants_data[label] = {
-            "assistant_id": asst.id,
-            "vector_store_id": vs.id
-        }
+    # The assistants are independent, so set them up concurrently; the run takes as
+    # long as the slowest one instead of the sum of all three.
+    with ThreadPoolExecutor(max_workers=len(ASSISTANTS)) as pool:
+        futures = {label: pool.submit(setup_assistant, label, config) for label, config in ASSISTANTS.items()}
+        assistants_data = {label: future.result() for label, future in futures.items()}
     
     # Save all assistant IDs
     set_assistant_ids(assistants_data)
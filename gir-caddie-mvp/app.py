@@ -1,38 +1,86 @@
-import os, base64, json, time
-from collections import deque
+import os, io, base64, json, time, asyncio, contextlib, hashlib, heapq, threading
+from array import array
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request, UploadFile
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from typing import Optional
-from openai import OpenAI
-from tenacity import retry, wait_exponential, stop_after_attempt
+from typing import BinaryIO, Optional
+from openai import AsyncOpenAI, APIConnectionError, InternalServerError, RateLimitError
+from PIL import Image, ImageOps
+from tenacity import retry, retry_if_exception_type, wait_random_exponential, stop_after_attempt
 
-# Load env + OpenAI client
+# orjson is optional (it is listed in requirements.txt); fall back to the stdlib.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Load env + OpenAI client. The async client keeps the event loop free while gpt-4o
+# works, so concurrent requests overlap; all calls share its connection pool.
 load_dotenv()
-ocli = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+ocli = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+# Caps in-flight gpt-4o calls per process so a burst of uploads queues here instead of
+# hitting the account's rate limit and paying for retried input tokens.
+OPENAI_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", "20"))
+_openai_semaphore = asyncio.Semaphore(OPENAI_CONCURRENCY)
+
+# Retry rate limits, dropped connections/timeouts, 5xx and malformed JSON replies; a 400 or
+# an auth error would fail the same way again, so let those through immediately. The backoff
+# is jittered so requests that failed together don't all retry in the same instant.
+_openai_retry = retry(
+    retry=retry_if_exception_type((RateLimitError, APIConnectionError, InternalServerError, ValueError)),
+    wait=wait_random_exponential(min=1, max=15),
+    stop=stop_after_attempt(4),
+)
 
 app = FastAPI()
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+@app.on_event("shutdown")
+async def shutdown():
+    await ocli.close()
+
+class _LatencyWindow:
+    """Ring buffer of the most recent latencies, stored unboxed in an array('d')."""
+    def __init__(self, size: int = 1000):
+        self._buf = array("d")
+        self._size = size
+        self._next = 0
+
+    def append(self, value: float):
+        if len(self._buf) < self._size:
+            self._buf.append(value)
+        else:
+            self._buf[self._next] = value
+        self._next = (self._next + 1) % self._size
+
+    def __len__(self):
+        return len(self._buf)
+
+    def __iter__(self):
+        return iter(self._buf)
+
 # Metrics tracking
 _metrics = {
     "total_requests": 0,
     "total_input_tokens": 0,
     "total_output_tokens": 0,
-    "latencies": deque(maxlen=1000),  # Keep last 1000 latencies for p95 calculation
+    "latencies": _LatencyWindow(1000),  # Keep last 1000 latencies for p95 calculation
     "endpoint_requests": {
         "parse_scorecard": 0,
         "extract_layout": 0,
+        "extract_layouts": 0,
         "recalibrate_layout": 0,
         "plan_hole": 0
     },
     "endpoint_latencies": {
-        "parse_scorecard": deque(maxlen=1000),
-        "extract_layout": deque(maxlen=1000),
-        "recalibrate_layout": deque(maxlen=1000),
-        "plan_hole": deque(maxlen=1000)
+        "parse_scorecard": _LatencyWindow(1000),
+        "extract_layout": _LatencyWindow(1000),
+        "extract_layouts": _LatencyWindow(1000),
+        "recalibrate_layout": _LatencyWindow(1000),
+        "plan_hole": _LatencyWindow(1000)
     }
 }
 
@@ -40,14 +88,47 @@ def _calculate_p95(latencies):
     """Calculate 95th percentile latency."""
     if not latencies:
         return 0.0
-    sorted_latencies = sorted(latencies)
-    index = int(len(sorted_latencies) * 0.95)
-    return sorted_latencies[index] if index < len(sorted_latencies) else sorted_latencies[-1]
+    # The p95 is the k-th largest sample, so only the top 5% needs ordering, not the window
+    k = len(latencies) - int(len(latencies) * 0.95)
+    return heapq.nlargest(k, latencies)[-1]
+
+# Handlers record metrics on the event loop while the sync /metrics handler reads them from
+# the threadpool, so a scrape could see a window mid-update; one lock covers both.
+_metrics_lock = threading.Lock()
+
+def _record_openai_call(resp, latency: float):
+    with _metrics_lock:
+        _metrics["total_requests"] += 1
+        _metrics["total_input_tokens"] += resp.usage.prompt_tokens
+        _metrics["total_output_tokens"] += resp.usage.completion_tokens
+        _metrics["latencies"].append(latency)
+
+def _record_endpoint(endpoint: str, latency: float):
+    with _metrics_lock:
+        _metrics["endpoint_requests"][endpoint] += 1
+        _metrics["endpoint_latencies"][endpoint].append(latency)
+
+# index.html is kept in memory with its ETag and re-read only when its mtime changes, so
+# edits to the mounted static/ directory still show up without a restart
+_index_cache = None  # (mtime_ns, html bytes, etag)
+
+def _load_index():
+    global _index_cache
+    mtime_ns = os.stat("static/index.html").st_mtime_ns
+    if _index_cache is None or _index_cache[0] != mtime_ns:
+        with open("static/index.html","rb") as f:
+            html = f.read()
+        _index_cache = (mtime_ns, html, '"' + hashlib.sha1(html).hexdigest() + '"')
+    return _index_cache
 
 @app.get("/", response_class=HTMLResponse)
-def index():
-    with open("static/index.html","r",encoding="utf-8") as f:
-        return HTMLResponse(f.read())
+def index(req: Request):
+    _, html, etag = _load_index()
+    # no-cache still lets the browser keep its copy; it just revalidates, usually getting a 304
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if req.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(html, headers=headers)
 
 class PlayerProfile(BaseModel):
     player_id: str = "user"
@@ -56,20 +137,110 @@ class PlayerProfile(BaseModel):
 
 @app.post("/api/profile")
 async def api_profile(req: Request):
-    data = await req.json()
     try:
-        prof = PlayerProfile(**data)
+        # Validate straight from the raw body instead of parsing to a dict first
+        prof = PlayerProfile.model_validate_json(await req.body())
     except Exception as e:
         return JSONResponse({"error": f"Bad profile: {e}"}, status_code=400)
     os.makedirs("uploads", exist_ok=True)
-    with open("uploads/player_profile.json","w",encoding="utf-8") as f:
-        json.dump(prof.model_dump(), f, ensure_ascii=False, indent=2)
+    await asyncio.to_thread(_write_json, "uploads/player_profile.json", prof.model_dump())
     return {"ok": True}
 
+def _loads(s):
+    return orjson.loads(s) if orjson is not None else json.loads(s)
+
+def _dumps(o) -> str:
+    if orjson is not None:
+        return orjson.dumps(o).decode("utf-8")
+    return json.dumps(o, ensure_ascii=False, separators=(",", ":"))
+
+# uploads/*.json are only read back by the app, so write them compact unless
+# PRETTY_JSON=1 asks for indented files to read while debugging
+PRETTY_JSON = os.getenv("PRETTY_JSON") == "1"
+
+def _read_json(path: str):
+    with open(path, "rb") as f:
+        return _loads(f.read())
+
+def _write_json(path: str, data, pretty: bool = PRETTY_JSON):
+    if orjson is not None:
+        out = orjson.dumps(data, option=orjson.OPT_INDENT_2 if pretty else 0)
+    else:
+        out = json.dumps(data, ensure_ascii=False, indent=2 if pretty else None).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(out)
+
 def _b64(b: bytes) -> str:
     import base64
     return base64.b64encode(b).decode("utf-8")
 
+# gpt-4o rescales images to fit 2048px and then to a 768px short side before reading them,
+# so a phone photo's full resolution is never used; it only costs upload time.
+MAX_IMAGE_SIDE = 1568
+
+def _preprocess_image(f: BinaryIO, max_side: int = MAX_IMAGE_SIDE, quality: int = 85) -> bytes:
+    """
+    Downscale an uploaded image to max_side and re-encode it as JPEG for the vision calls.
+    Reads from the upload's spooled file, so the original bytes are only loaded into memory
+    when they are sent unchanged.
+    """
+    f.seek(0)
+    try:
+        img = Image.open(f)
+        if img.format == "JPEG" and max(img.size) <= max_side:
+            f.seek(0)
+            return f.read()  # already small enough; re-encoding would only lose quality
+        # Let the JPEG decoder scale by 1/2, 1/4 or 1/8 while decoding, so a phone photo's
+        # full-resolution bitmap is never built; no-op for other formats
+        ratio = max_side / max(img.size)
+        img.draft("RGB", (max(1, int(img.width * ratio)), max(1, int(img.height * ratio))))
+        img = ImageOps.exif_transpose(img).convert("RGB")  # keep phone photos upright
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, "JPEG", quality=quality, optimize=True)
+        return out.getvalue()
+    except Exception:
+        f.seek(0)
+        return f.read()  # not something Pillow can read; send it as uploaded
+
+# Model results are cached on disk by content: the sha256 of the (preprocessed) image plus
+# the prompts and parameters, so re-uploading the same scorecard or hole image skips gpt-4o.
+# Editing a prompt changes the key, which retires the old entries without a manual version bump.
+# Plans use the same cache, keyed on their full prompt (profile, hole and layout).
+CACHE_DIR = os.path.join("uploads", ".cache")
+CACHE_MAX_ENTRIES = 500
+
+def _cache_path(image_bytes: bytes, *parts) -> str:
+    h = hashlib.sha256(image_bytes)
+    for part in parts:
+        h.update(b"\0" + str(part).encode("utf-8"))
+    return os.path.join(CACHE_DIR, h.hexdigest() + ".json")
+
+def _cache_get(path: str) -> Optional[dict]:
+    try:
+        data = _read_json(path)
+        os.utime(path)  # mark as recently used so eviction keeps it
+        return data
+    except (OSError, ValueError):
+        return None
+
+def _cache_put(path: str, data: dict):
+    """Store a result, then evict the least recently used entries beyond CACHE_MAX_ENTRIES."""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Unique per thread: two to_thread writers of the same key in one worker must not
+        # share (and truncate) a temp file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        _write_json(tmp_path, data)
+        os.replace(tmp_path, path)
+        entries = [e for e in os.scandir(CACHE_DIR) if e.name.endswith(".json")]
+        if len(entries) > CACHE_MAX_ENTRIES:
+            entries.sort(key=lambda e: e.stat().st_mtime)
+            for e in entries[:-CACHE_MAX_ENTRIES]:
+                os.remove(e.path)
+    except OSError:
+        pass  # the cache is best-effort; a failed write only costs a future API call
+
 SCORECARD_SYSTEM = (
     "You are a golf scorecard extractor. "
     "Return STRICT JSON with course name, list of tees, and per-hole yardages by tee and par. "
@@ -77,47 +248,52 @@ SCORECARD_SYSTEM = (
     "\"holes\": [{\"num\": number, \"par\": number, \"yardages\": { [tee]: number|null }}]}"
 )
 
-@retry(wait=wait_exponential(min=1, max=15), stop=stop_after_attempt(4))
-def _parse_scorecard_with_openai(image_bytes: bytes) -> dict:
+@_openai_retry
+async def _parse_scorecard_with_openai(image_bytes: bytes) -> dict:
+    cache_path = _cache_path(image_bytes, "gpt-4o", SCORECARD_SYSTEM)
+    cached = await asyncio.to_thread(_cache_get, cache_path)
+    if cached is not None:
+        return cached
     b64 = _b64(image_bytes)
-    start_time = time.time()
-    resp = ocli.chat.completions.create(
-        model="gpt-4o",
-        response_format={"type":"json_object"},
-        messages=[
-            {"role": "system", "content": SCORECARD_SYSTEM},
-            {"role": "user", "content": [
-                {"type":"text","text":"Extract the scorecard into JSON (strict schema)."},
-                {"type":"image_url","image_url":{"url": f"data:image/jpeg;base64,{b64}"}}
-            ]},
-        ],
-        temperature=0.0,
-    )
-    latency = time.time() - start_time
+    async with _openai_semaphore:
+        start_time = time.time()
+        resp = await ocli.chat.completions.create(
+            model="gpt-4o",
+            response_format={"type":"json_object"},
+            messages=[
+                {"role": "system", "content": SCORECARD_SYSTEM},
+                {"role": "user", "content": [
+                    {"type":"text","text":"Extract the scorecard into JSON (strict schema)."},
+                    {"type":"image_url","image_url":{"url": f"data:image/jpeg;base64,{b64}"}}
+                ]},
+            ],
+            temperature=0.0,
+        )
+        latency = time.time() - start_time
     
     # Track metrics
-    _metrics["total_requests"] += 1
-    _metrics["total_input_tokens"] += resp.usage.prompt_tokens
-    _metrics["total_output_tokens"] += resp.usage.completion_tokens
-    _metrics["latencies"].append(latency)
-    _metrics["endpoint_requests"]["parse_scorecard"] += 1
-    _metrics["endpoint_latencies"]["parse_scorecard"].append(latency)
+    _record_openai_call(resp, latency)
     
-    return json.loads(resp.choices[0].message.content)
+    data = _loads(resp.choices[0].message.content)
+    await asyncio.to_thread(_cache_put, cache_path, data)
+    return data
 
 from fastapi import UploadFile
 
 @app.post("/api/parse-scorecard")
 async def api_parse_scorecard(req: Request):
+    start_time = time.time()
     form = await req.form()
     file: UploadFile = form.get("scorecard_image")
     if not file:
         return JSONResponse({"error":"scorecard_image is required"}, status_code=400)
-    img_bytes = await file.read()
-    data = _parse_scorecard_with_openai(img_bytes)
+    # Decoding/resizing is CPU-bound, so keep it off the event loop
+    img_bytes = await asyncio.to_thread(_preprocess_image, file.file)
+    data = await _parse_scorecard_with_openai(img_bytes)
     os.makedirs("uploads", exist_ok=True)
-    with open("uploads/scorecard.json","w",encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    await asyncio.to_thread(_write_json, "uploads/scorecard.json", data)
+    endpoint_latency = time.time() - start_time
+    _record_endpoint("parse_scorecard", endpoint_latency)
     return {"data": data}
 
 
@@ -146,47 +322,72 @@ LAYOUT_SYSTEM = (
     "\"notes\": string }"
 )
 
-@retry(wait=wait_exponential(min=1, max=15), stop=stop_after_attempt(4))
-def _extract_layout_with_openai(image_bytes: bytes, hole_num: int, tee_yardage: int, hazard_corrections: Optional[list] = None) -> dict:
+# OpenAI caches prompt prefixes, so everything identical across calls (system prompt, these
+# instructions) comes first, then the image (shared by a hole's recalibrations), and only
+# then the per-call hole number, yardage and corrections.
+LAYOUT_INSTRUCTIONS = (
+    "Analyze the hole whose number is given after this image. "
+    "If this is a full course map with multiple holes, find and focus ONLY on that hole. "
+    "Look for its number in a circle or label to identify the correct hole. "
+    "Identify the tee box (starting point) and green (red flag) for that hole. "
+    "Compute pixel_per_yard based on the distance from tee to green, using the tee-to-green yardage given after the image. "
+    "For each hazard that affects that hole, calculate the yardage from the tee to the nearest point of the hazard. "
+    "Only include hazards that are relevant to that hole, not other holes."
+)
+
+# The per-hole text that follows the image; only these fields change between calls
+LAYOUT_HOLE_TEMPLATE = "HOLE NUMBER: {hole_num}. Tee-to-green yardage for this hole: {tee_yardage} yards.{corrections}"
+LAYOUT_CORRECTION_TEMPLATE = "Hazard at {yardage} yards: {type} is on the {direction} side of the fairway."
+LAYOUT_CORRECTIONS_TEMPLATE = "\n\nIMPORTANT CORRECTIONS: {corrections} Use these corrections to accurately identify hazard positions."
+
+@_openai_retry
+async def _extract_layout_with_openai(image_bytes: bytes, hole_num: int, tee_yardage: int, hazard_corrections: Optional[list] = None,
+                                     limit: Optional[asyncio.Semaphore] = None) -> dict:
     b64 = _b64(image_bytes)
     
     correction_text = ""
     if hazard_corrections:
-        corrections_list = []
-        for corr in hazard_corrections:
-            corrections_list.append(f"Hazard at {corr.get('yardage_to_hazard', 'unknown')} yards: {corr.get('type', 'unknown')} is on the {corr.get('direction', 'unknown')} side of the fairway.")
-        correction_text = "\n\nIMPORTANT CORRECTIONS: " + " ".join(corrections_list) + " Use these corrections to accurately identify hazard positions."
+        correction_text = LAYOUT_CORRECTIONS_TEMPLATE.format(corrections=" ".join(
+            LAYOUT_CORRECTION_TEMPLATE.format(
+                yardage=corr.get("yardage_to_hazard", "unknown"),
+                type=corr.get("type", "unknown"),
+                direction=corr.get("direction", "unknown"),
+            )
+            for corr in hazard_corrections
+        ))
+    hole_text = LAYOUT_HOLE_TEMPLATE.format(hole_num=hole_num, tee_yardage=tee_yardage, corrections=correction_text)
     
-    start_time = time.time()
-    resp = ocli.chat.completions.create(
-        model="gpt-4o",
-        response_format={"type":"json_object"},
-        messages=[
-            {"role":"system","content": LAYOUT_SYSTEM},
-            {"role":"user","content":[
-                {"type":"text","text": f"Analyze HOLE NUMBER {hole_num} in this image. "
-                                        f"If this is a full course map with multiple holes, find and focus ONLY on hole {hole_num}. "
-                                        f"Look for the number {hole_num} in a circle or label to identify the correct hole. "
-                                        f"Tee-to-green yardage for this hole: {tee_yardage} yards. "
-                                        f"Identify the tee box (starting point) and green (red flag) for hole {hole_num}. "
-                                        f"Compute pixel_per_yard based on the distance from tee to green. "
-                                        f"For each hazard that affects hole {hole_num}, calculate the yardage from the tee to the nearest point of the hazard. "
-                                        f"Only include hazards that are relevant to hole {hole_num}, not other holes. "
-                                        f"{correction_text}"},
-                {"type":"image_url","image_url":{"url": f"data:image/jpeg;base64,{b64}"}}
-            ]}
-        ],
-        temperature=0.2,
-    )
-    latency = time.time() - start_time
+    cache_path = _cache_path(image_bytes, "gpt-4o", LAYOUT_SYSTEM, LAYOUT_INSTRUCTIONS, hole_text)
+    cached = await asyncio.to_thread(_cache_get, cache_path)
+    if cached is not None:
+        return cached
+    
+    # limit (the batch endpoint's cap) is held for this attempt only, not across retries,
+    # so a call waiting out a rate-limit backoff doesn't keep one of the batch's slots
+    batch_slot = limit if limit is not None else contextlib.nullcontext()
+    async with batch_slot, _openai_semaphore:
+        start_time = time.time()
+        resp = await ocli.chat.completions.create(
+            model="gpt-4o",
+            response_format={"type":"json_object"},
+            messages=[
+                {"role":"system","content": LAYOUT_SYSTEM},
+                {"role":"user","content":[
+                    {"type":"text","text": LAYOUT_INSTRUCTIONS},
+                    {"type":"image_url","image_url":{"url": f"data:image/jpeg;base64,{b64}"}},
+                    {"type":"text","text": hole_text}
+                ]}
+            ],
+            temperature=0.2,
+        )
+        latency = time.time() - start_time
     
     # Track metrics
-    _metrics["total_requests"] += 1
-    _metrics["total_input_tokens"] += resp.usage.prompt_tokens
-    _metrics["total_output_tokens"] += resp.usage.completion_tokens
-    _metrics["latencies"].append(latency)
+    _record_openai_call(resp, latency)
     
-    return json.loads(resp.choices[0].message.content)
+    data = _loads(resp.choices[0].message.content)
+    await asyncio.to_thread(_cache_put, cache_path, data)
+    return data
 
 @app.post("/api/extract-hole-layout")
 async def api_extract_layout(req: Request):
@@ -197,15 +398,47 @@ async def api_extract_layout(req: Request):
     tee_yardage = int(form.get("tee_yardage", "400"))
     if not file:
         return JSONResponse({"error":"hole_image is required"}, status_code=400)
-    img_bytes = await file.read()
-    data = _extract_layout_with_openai(img_bytes, hole_num, tee_yardage)
-    with open(f"uploads/hole_{hole_num}_layout.json","w",encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    # Decoding/resizing is CPU-bound, so keep it off the event loop
+    img_bytes = await asyncio.to_thread(_preprocess_image, file.file)
+    data = await _extract_layout_with_openai(img_bytes, hole_num, tee_yardage)
+    await asyncio.to_thread(_write_json, f"uploads/hole_{hole_num}_layout.json", data)
     endpoint_latency = time.time() - start_time
-    _metrics["endpoint_requests"]["extract_layout"] += 1
-    _metrics["endpoint_latencies"]["extract_layout"].append(endpoint_latency)
+    _record_endpoint("extract_layout", endpoint_latency)
     return {"data": data}
 
+# Cap on concurrent layout calls from one batch, so a full course doesn't hit rate limits
+LAYOUT_BATCH_CONCURRENCY = 5
+_layout_semaphore = asyncio.Semaphore(LAYOUT_BATCH_CONCURRENCY)
+
+@app.post("/api/extract-hole-layouts")
+async def api_extract_layouts(req: Request):
+    """Batch /api/extract-hole-layout: repeat hole_image, hole_num and tee_yardage once per hole."""
+    start_time = time.time()
+    form = await req.form()
+    files = form.getlist("hole_image")
+    hole_nums = form.getlist("hole_num")
+    tee_yardages = form.getlist("tee_yardage")
+    if not files:
+        return JSONResponse({"error":"hole_image is required"}, status_code=400)
+    if not (len(files) == len(hole_nums) == len(tee_yardages)):
+        return JSONResponse({"error":"hole_image, hole_num and tee_yardage must be given once per hole"}, status_code=400)
+
+    async def extract_one(file: UploadFile, hole_num: int, tee_yardage: int) -> dict:
+        img_bytes = await asyncio.to_thread(_preprocess_image, file.file)
+        data = await _extract_layout_with_openai(img_bytes, hole_num, tee_yardage, limit=_layout_semaphore)
+        await asyncio.to_thread(_write_json, f"uploads/hole_{hole_num}_layout.json", data)
+        return data
+
+    os.makedirs("uploads", exist_ok=True)
+    # Holes are independent, so extract them concurrently (at most LAYOUT_BATCH_CONCURRENCY at once)
+    layouts = await asyncio.gather(*(
+        extract_one(file, int(hole_num), int(tee_yardage))
+        for file, hole_num, tee_yardage in zip(files, hole_nums, tee_yardages)
+    ))
+    endpoint_latency = time.time() - start_time
+    _record_endpoint("extract_layouts", endpoint_latency)
+    return {"data": layouts}
+
 @app.post("/api/recalibrate-hole-layout")
 async def api_recalibrate_layout(req: Request):
     start_time = time.time()
@@ -219,17 +452,16 @@ async def api_recalibrate_layout(req: Request):
         return JSONResponse({"error":"hole_image is required"}, status_code=400)
     
     try:
-        hazard_corrections = json.loads(hazard_corrections_json)
+        hazard_corrections = _loads(hazard_corrections_json)
     except:
         return JSONResponse({"error":"Invalid hazard_corrections JSON"}, status_code=400)
     
-    img_bytes = await file.read()
-    data = _extract_layout_with_openai(img_bytes, hole_num, tee_yardage, hazard_corrections)
-    with open(f"uploads/hole_{hole_num}_layout.json","w",encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    # Decoding/resizing is CPU-bound, so keep it off the event loop
+    img_bytes = await asyncio.to_thread(_preprocess_image, file.file)
+    data = await _extract_layout_with_openai(img_bytes, hole_num, tee_yardage, hazard_corrections)
+    await asyncio.to_thread(_write_json, f"uploads/hole_{hole_num}_layout.json", data)
     endpoint_latency = time.time() - start_time
-    _metrics["endpoint_requests"]["recalibrate_layout"] += 1
-    _metrics["endpoint_latencies"]["recalibrate_layout"].append(endpoint_latency)
+    _record_endpoint("recalibrate_layout", endpoint_latency)
     return {"data": data}
 
 class HoleSelection(BaseModel):
@@ -247,86 +479,106 @@ PLANNER_SYSTEM = (
     "\"rationale\": string[], \"estimated_gir_probability\": number }"
 )
 
-@retry(wait=wait_exponential(min=1, max=15), stop=stop_after_attempt(4))
-def _plan_with_openai(player_json: dict, hole_json: dict, layout_json: dict, hole_num: int, tee_box: str) -> dict:
-    par = None
-    tee_yardage = None
-    for h in hole_json.get("holes", []):
-        if int(h.get("num")) == int(hole_num):
-            par = h.get("par")
-            yardages = (h.get("yardages") or {})
-            tee_yardage = yardages.get(tee_box)
-            break
+# plan-hole only needs one hole of the scorecard, so keep the holes indexed by number and
+# re-read the file only when a new scorecard is saved (its mtime or size changes)
+_scorecard_index_cache = None  # ((mtime_ns, size), {hole_num: hole})
+
+def _load_scorecard_index(path: str) -> dict:
+    global _scorecard_index_cache
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    if _scorecard_index_cache is None or _scorecard_index_cache[0] != stamp:
+        holes = {}
+        for h in _read_json(path).get("holes", []):
+            try:
+                holes.setdefault(int(h.get("num")), h)
+            except (TypeError, ValueError):
+                continue  # a row without a usable hole number can't be selected anyway
+        _scorecard_index_cache = (stamp, holes)
+    return _scorecard_index_cache[1]
+
+@_openai_retry
+async def _plan_with_openai(player_json: dict, hole: Optional[dict], layout_json: dict, hole_num: int, tee_box: str) -> dict:
+    par = hole.get("par") if hole else None
+    tee_yardage = (hole.get("yardages") or {}).get(tee_box) if hole else None
 
     messages = [
         {"role":"system","content": PLANNER_SYSTEM},
-        {"role":"user","content": f"Player profile:\n{json.dumps(player_json, ensure_ascii=False)}"},
+        {"role":"user","content": f"Player profile:\n{_dumps(player_json)}"},
         {"role":"user","content": f"Hole context (tee={tee_box}, par={par}, yardage={tee_yardage}):\n"
-                                  f"{json.dumps({'num':hole_num,'par':par,'yardage':tee_yardage,'tee_box':tee_box}, ensure_ascii=False)}"},
-        {"role":"user","content": f"Layout & hazards:\n{json.dumps(layout_json, ensure_ascii=False)}"},
+                                  f"{_dumps({'num':hole_num,'par':par,'yardage':tee_yardage,'tee_box':tee_box})}"},
+        {"role":"user","content": f"Layout & hazards:\n{_dumps(layout_json)}"},
     ]
-    start_time = time.time()
-    resp = ocli.chat.completions.create(
-        model="gpt-4o",
-        response_format={"type":"json_object"},
-        messages=messages,
-        temperature=0.2,
-    )
-    latency = time.time() - start_time
+    # Switching tee boxes back and forth asks for the same plans again
+    cache_path = _cache_path(b"plan", "gpt-4o", *(m["content"] for m in messages))
+    cached = await asyncio.to_thread(_cache_get, cache_path)
+    if cached is not None:
+        return cached
+    
+    async with _openai_semaphore:
+        start_time = time.time()
+        resp = await ocli.chat.completions.create(
+            model="gpt-4o",
+            response_format={"type":"json_object"},
+            messages=messages,
+            temperature=0.0,
+        )
+        latency = time.time() - start_time
     
     # Track metrics
-    _metrics["total_requests"] += 1
-    _metrics["total_input_tokens"] += resp.usage.prompt_tokens
-    _metrics["total_output_tokens"] += resp.usage.completion_tokens
-    _metrics["latencies"].append(latency)
+    _record_openai_call(resp, latency)
     
-    return json.loads(resp.choices[0].message.content)
+    data = _loads(resp.choices[0].message.content)
+    await asyncio.to_thread(_cache_put, cache_path, data)
+    return data
 
 @app.post("/api/plan-hole")
 async def api_plan_hole(req: Request):
     start_time = time.time()
-    body = await req.json()
     try:
-        sel = HoleSelection(**{"hole_num": body.get("hole_num"), "tee_box": body.get("tee_box")})
+        sel = HoleSelection.model_validate_json(await req.body())
     except Exception as e:
         return JSONResponse({"error": f"Bad selection: {e}"}, status_code=400)
 
     try:
-        player = json.load(open("uploads/player_profile.json","r",encoding="utf-8"))
-        scorecard = json.load(open("uploads/scorecard.json","r",encoding="utf-8"))
-        layout = json.load(open(f"uploads/hole_{sel.hole_num}_layout.json","r",encoding="utf-8"))
+        player, holes, layout = await asyncio.gather(
+            asyncio.to_thread(_read_json, "uploads/player_profile.json"),
+            asyncio.to_thread(_load_scorecard_index, "uploads/scorecard.json"),
+            asyncio.to_thread(_read_json, f"uploads/hole_{sel.hole_num}_layout.json"),
+        )
     except FileNotFoundError:
         return JSONResponse({"error":"Missing player/scorecard/layout. Upload those first."}, status_code=400)
 
-    plan = _plan_with_openai(player, scorecard, layout, sel.hole_num, sel.tee_box)
+    plan = await _plan_with_openai(player, holes.get(sel.hole_num), layout, sel.hole_num, sel.tee_box)
     endpoint_latency = time.time() - start_time
-    _metrics["endpoint_requests"]["plan_hole"] += 1
-    _metrics["endpoint_latencies"]["plan_hole"].append(endpoint_latency)
+    _record_endpoint("plan_hole", endpoint_latency)
     return {"plan": plan}
 
 @app.get("/metrics")
 def metrics():
     """Returns metrics: request counts, token usage, and p95 latency."""
-    p95_latency = _calculate_p95(_metrics["latencies"])
-    total_tokens = _metrics["total_input_tokens"] + _metrics["total_output_tokens"]
-    
-    # Calculate per-endpoint metrics
-    endpoint_metrics = {}
-    for endpoint in _metrics["endpoint_requests"].keys():
-        endpoint_p95 = _calculate_p95(_metrics["endpoint_latencies"][endpoint])
-        endpoint_metrics[endpoint] = {
-            "requests": _metrics["endpoint_requests"][endpoint],
-            "p95_latency_seconds": round(endpoint_p95, 4),
-            "p95_latency_ms": round(endpoint_p95 * 1000, 2)
+    # Computing the p95s takes microseconds, so hold the lock rather than copying the windows
+    with _metrics_lock:
+        p95_latency = _calculate_p95(_metrics["latencies"])
+        total_tokens = _metrics["total_input_tokens"] + _metrics["total_output_tokens"]
+        
+        # Calculate per-endpoint metrics
+        endpoint_metrics = {}
+        for endpoint in _metrics["endpoint_requests"].keys():
+            endpoint_p95 = _calculate_p95(_metrics["endpoint_latencies"][endpoint])
+            endpoint_metrics[endpoint] = {
+                "requests": _metrics["endpoint_requests"][endpoint],
+                "p95_latency_seconds": round(endpoint_p95, 4),
+                "p95_latency_ms": round(endpoint_p95 * 1000, 2)
+            }
+        
+        return {
+            "total_requests": _metrics["total_requests"],
+            "total_tokens": total_tokens,
+            "total_input_tokens": _metrics["total_input_tokens"],
+            "total_output_tokens": _metrics["total_output_tokens"],
+            "tokens_per_request": round(total_tokens / _metrics["total_requests"], 2) if _metrics["total_requests"] > 0 else 0,
+            "p95_latency_seconds": round(p95_latency, 4),
+            "p95_latency_ms": round(p95_latency * 1000, 2),
+            "endpoints": endpoint_metrics
         }
-    
-    return {
-        "total_requests": _metrics["total_requests"],
-        "total_tokens": total_tokens,
-        "total_input_tokens": _metrics["total_input_tokens"],
-        "total_output_tokens": _metrics["total_output_tokens"],
-        "tokens_per_request": round(total_tokens / _metrics["total_requests"], 2) if _metrics["total_requests"] > 0 else 0,
-        "p95_latency_seconds": round(p95_latency, 4),
-        "p95_latency_ms": round(p95_latency * 1000, 2),
-        "endpoints": endpoint_metrics
-    }